@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class GoodsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goods'
-    verbose_name = 'Товары'
\ No newline at end of file
+    verbose_name = 'Товары'
+
+    def ready(self):
+        import goods.signals
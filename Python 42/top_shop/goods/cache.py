@@ -0,0 +1,20 @@
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+
+from goods.models import Categories, Products
+
+
+CATEGORIES_KEY = "goods:categories"
+PRODUCT_KEY = "goods:product:{slug}"
+TIMEOUT = 60 * 60
+
+
+def get_categories():
+    return cache.get_or_set(CATEGORIES_KEY, lambda: list(Categories.objects.all()), TIMEOUT)
+
+
+def get_product(slug):
+    # 404 is raised by the loader, so a missing product is never cached
+    return cache.get_or_set(
+        PRODUCT_KEY.format(slug=slug), lambda: get_object_or_404(Products, slug=slug), TIMEOUT
+    )
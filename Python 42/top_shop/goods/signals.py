@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from goods.cache import CATEGORIES_KEY, PRODUCT_KEY
+from goods.models import Categories, Products
+
+
+def invalidate_categories(sender, instance, **kwargs):
+    cache.delete(CATEGORIES_KEY)
+
+
+def invalidate_product(sender, instance, **kwargs):
+    cache.delete(PRODUCT_KEY.format(slug=instance.slug))
+
+
+def invalidate_old_product_slug(sender, instance, **kwargs):
+    # the page under the previous slug has to go as well
+    if instance.pk:
+        old_slug = Products.objects.filter(pk=instance.pk).values_list("slug", flat=True).first()
+        if old_slug and old_slug != instance.slug:
+            cache.delete(PRODUCT_KEY.format(slug=old_slug))
+
+
+post_save.connect(invalidate_categories, sender=Categories)
+post_delete.connect(invalidate_categories, sender=Categories)
+pre_save.connect(invalidate_old_product_slug, sender=Products)
+post_save.connect(invalidate_product, sender=Products)
+post_delete.connect(invalidate_product, sender=Products)
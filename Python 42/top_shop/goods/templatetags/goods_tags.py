@@ -2,7 +2,7 @@ from django import template
 from django.utils.http import urlencode
 
 
-from goods.models import Categories
+from goods.cache import get_categories
 
 
 register = template.Library()
@@ -10,7 +10,7 @@ register = template.Library()
 
 @register.simple_tag()
 def tag_categories():
-    return Categories.objects.all()
+    return get_categories()
 
 
 @register.simple_tag(takes_context=True)
@@ -1,6 +1,7 @@
 from django.core.paginator import Paginator
 from django.shortcuts import get_list_or_404, get_object_or_404, render
 
+from goods.cache import get_product
 from goods.models import Products
 from goods.utils import q_search
 
@@ -36,7 +37,7 @@ def catalog(request, category_slug=None):
 
 
 def product(request, product_slug):
-    product = Products.objects.get(slug=product_slug)
+    product = get_product(product_slug)
 
     context = {"product": product}
 
@@ -0,0 +1,199 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+
+# per-process memory tiers, shared by the per-thread backend instances
+_local_tiers = {}
+_local_locks = {}
+
+
+# A bounded in-process LRU (TTL + size accounting) in front of a shared
+# backend, FileBasedCache by default. Every key has a version token next to
+# it in the shared backend that each write on any worker replaces; a value
+# served from memory is checked against its token at most once per
+# VALIDATE_INTERVAL seconds, in between a hit costs no filesystem syscalls.
+# A value read from the shared tier stays in memory for LOCAL_TIMEOUT at most.
+#
+# OPTIONS: SHARED_BACKEND, SHARED_OPTIONS, LOCAL_MAX_ENTRIES (300),
+# LOCAL_MAX_BYTES (16 MB), LOCAL_TIMEOUT (300 s), VALIDATE_INTERVAL (1 s)
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.pop("OPTIONS", None) or {})
+        shared_class = import_string(
+            options.pop("SHARED_BACKEND", "django.core.cache.backends.filebased.FileBasedCache")
+        )
+        self.local_max_entries = int(options.pop("LOCAL_MAX_ENTRIES", 300))
+        self.local_max_bytes = int(options.pop("LOCAL_MAX_BYTES", 16 * 1024 * 1024))
+        self.local_timeout = float(options.pop("LOCAL_TIMEOUT", 300))
+        self.validate_interval = float(options.pop("VALIDATE_INTERVAL", 1))
+        shared_options = options.pop("SHARED_OPTIONS", {})
+
+        super().__init__({**params, "OPTIONS": options})
+        self.shared = shared_class(location, {**params, "OPTIONS": shared_options})
+
+        name = str(location)
+        self._local = _local_tiers.setdefault(name, LocalTier())
+        self._lock = _local_locks.setdefault(name, threading.Lock())
+
+    # the key and version arguments are passed on to the shared backend as
+    # they are, it applies KEY_PREFIX/KEY_FUNCTION itself
+
+    def _local_key(self, key, version):
+        return self.shared.make_key(key, version)
+
+    @staticmethod
+    def _version_key(key):
+        return f"{key}:tier-version"
+
+    def _seconds(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _remember(self, key, version, value, token, timeout):
+        data = pickle.dumps(value, self.pickle_protocol)
+        ttl = self.local_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._local.put(
+                self._local_key(key, version), data, token, time.monotonic() + ttl,
+                self.local_max_entries, self.local_max_bytes,
+            )
+
+    def _publish(self, key, version):
+        # new token for the key: memory tiers of other workers drop the value
+        # at their next validation
+        token = uuid.uuid4().hex
+        self.shared.set(self._version_key(key), token, None, version=version)
+        return token
+
+    def _forget(self, key, version):
+        with self._lock:
+            self._local.pop(self._local_key(key, version))
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(local_key, now)
+
+        if entry is not None:
+            if now - entry.checked_at < self.validate_interval:
+                return pickle.loads(entry.data)
+            token = self.shared.get(self._version_key(key), version=version)
+            if token == entry.token:
+                entry.checked_at = now
+                return pickle.loads(entry.data)
+            self._forget(key, version)
+
+        # the token is read before the value: a write in between leaves an
+        # old token next to the new value and costs one refetch, never a
+        # stale value
+        token = self.shared.get(self._version_key(key), version=version)
+        value = self.shared.get(key, self._missing_key, version=version)
+        if value is self._missing_key:
+            return default
+        self._remember(key, version, value, token, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        token = self._publish(key, version)
+        self._remember(key, version, value, token, self._seconds(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        token = self._publish(key, version)
+        self._remember(key, version, value, token, self._seconds(timeout))
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(key, version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        self._publish(key, version)
+        self._forget(key, version)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        # counters live in the shared backend only
+        value = self.shared.incr(key, delta, version=version)
+        self._publish(key, version)
+        self._forget(key, version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, self._missing_key, version=version) is not self._missing_key
+
+    def clear(self):
+        # the tokens go too, so other workers refetch everything
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def local_stats(self):
+        with self._lock:
+            return {"entries": len(self._local.entries), "bytes": self._local.size}
+
+
+class LocalEntry:
+    __slots__ = ("data", "token", "expires_at", "checked_at")
+
+    def __init__(self, data, token, expires_at, checked_at):
+        self.data = data
+        self.token = token
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+class LocalTier:
+    # LRU of pickled values, bounded by entries and by bytes
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, data, token, expires_at, max_entries, max_bytes):
+        self.pop(key)
+        # a single value that big would flush the whole tier
+        if len(data) > max_bytes // 4:
+            return
+        self.entries[key] = LocalEntry(data, token, expires_at, time.monotonic())
+        self.size += len(data)
+        while len(self.entries) > max_entries or self.size > max_bytes:
+            self.pop(next(iter(self.entries)))
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
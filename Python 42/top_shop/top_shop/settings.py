@@ -90,8 +90,16 @@ DATABASES = {
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # in-process LRU in front of FileBasedCache, see top_shop/cache.py
+        "BACKEND": "top_shop.cache.TwoTierCache",
         "LOCATION": BASE_DIR / "cache",
+        "OPTIONS": {
+            "SHARED_BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCAL_MAX_ENTRIES": 300,
+            "LOCAL_MAX_BYTES": 16 * 1024 * 1024,
+            "LOCAL_TIMEOUT": 300,
+            "VALIDATE_INTERVAL": 1,
+        },
     }
 }
 
@@ -0,0 +1,157 @@
+import uuid
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from top_shop.cache import LocalTier, TwoTierCache
+
+
+class TwoTierCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        # the clock of the memory tier, moved by hand
+        patcher = mock.patch("top_shop.cache.time")
+        self.clock = patcher.start().monotonic
+        self.clock.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+        # LocMemCache instances of one location share their data, as workers
+        # share the cache directory
+        self.location = f"two-tier-{uuid.uuid4().hex}"
+
+    def make_cache(self, **options):
+        return TwoTierCache(self.location, {
+            "TIMEOUT": 300,
+            "OPTIONS": {
+                "SHARED_BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "VALIDATE_INTERVAL": 1,
+                **options,
+            },
+        })
+
+    def other_worker(self, **options):
+        # instances of one process share the memory tier, another process
+        # has its own
+        cache = self.make_cache(**options)
+        cache._local = LocalTier()
+        return cache
+
+    def test_memory_hit(self):
+        cache = self.make_cache()
+        cache.set("key", {"value": 1})
+        with mock.patch.object(cache.shared, "get") as shared_get:
+            self.assertEqual(cache.get("key"), {"value": 1})
+        shared_get.assert_not_called()
+        self.assertEqual(cache.get("missing", "default"), "default")
+        self.assertTrue(cache.has_key("key"))
+
+    def test_evicted_by_entries(self):
+        cache = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # "a" is used, so "b" is the least recently used one
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.local_stats()["entries"], 2)
+        self.assertIn(cache._local_key("a", None), cache._local.entries)
+        self.assertNotIn(cache._local_key("b", None), cache._local.entries)
+        # still in the shared tier
+        self.assertEqual(cache.get("b"), 2)
+
+    def test_evicted_by_bytes(self):
+        cache = self.make_cache(LOCAL_MAX_BYTES=4000)
+        for key in "abcde":
+            cache.set(key, "x" * 900)
+        self.assertLessEqual(cache.local_stats()["bytes"], 4000)
+        self.assertNotIn(cache._local_key("a", None), cache._local.entries)
+
+        # a value over a quarter of the limit is not kept in memory at all
+        cache.set("big", "x" * 2000)
+        self.assertNotIn(cache._local_key("big", None), cache._local.entries)
+        self.assertEqual(cache.get("big"), "x" * 2000)
+        self.assertLessEqual(cache.local_stats()["bytes"], 4000)
+
+    def test_ttl(self):
+        cache = self.make_cache(LOCAL_TIMEOUT=300)
+        cache.set("short", 1, timeout=10)
+        cache.set("long", 2)
+        # gone from the shared tier only, memory answers until its expiry
+        cache.shared.delete("short")
+        cache.shared.delete("long")
+        self.clock.return_value += 9
+        self.assertEqual(cache.get("short"), 1)
+        self.clock.return_value += 2
+        self.assertIsNone(cache.get("short"))
+        self.assertEqual(cache.local_stats()["entries"], 1)
+
+        # LOCAL_TIMEOUT bounds a value with a longer timeout
+        self.assertEqual(cache.get("long"), 2)
+        self.clock.return_value += 300
+        self.assertIsNone(cache.get("long"))
+
+    def test_invalidated_on_other_worker(self):
+        first, second = self.make_cache(), self.other_worker()
+        first.set("key", "old")
+        self.assertEqual(second.get("key"), "old")
+
+        first.set("key", "new")
+        # the memory tier is trusted for VALIDATE_INTERVAL
+        self.assertEqual(second.get("key"), "old")
+        self.clock.return_value += 1
+        self.assertEqual(second.get("key"), "new")
+
+        first.delete("key")
+        self.clock.return_value += 1
+        self.assertIsNone(second.get("key"))
+
+    def test_valid_token_not_refetched(self):
+        first, second = self.make_cache(), self.other_worker()
+        first.set("key", "value")
+        second.get("key")
+        self.clock.return_value += 1
+        with mock.patch.object(second.shared, "get", wraps=second.shared.get) as shared_get:
+            self.assertEqual(second.get("key"), "value")
+            # the token only
+            self.assertEqual(shared_get.call_count, 1)
+            self.assertEqual(second.get("key"), "value")
+            self.assertEqual(shared_get.call_count, 1)
+
+    def test_delete(self):
+        cache = self.make_cache()
+        cache.set("key", 1)
+        self.assertTrue(cache.delete("key"))
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.local_stats()["entries"], 0)
+        self.assertFalse(cache.delete("key"))
+
+    def test_incr(self):
+        first, second = self.make_cache(), self.other_worker()
+        first.set("counter", 1)
+        second.get("counter")
+        self.assertEqual(first.incr("counter"), 2)
+        self.assertEqual(first.incr("counter", 5), 7)
+        self.assertEqual(first.get("counter"), 7)
+        self.clock.return_value += 1
+        self.assertEqual(second.get("counter"), 7)
+        with self.assertRaises(ValueError):
+            first.incr("missing")
+
+    def test_clear(self):
+        first, second = self.make_cache(), self.other_worker()
+        first.set("key", 1)
+        second.get("key")
+        first.clear()
+        self.assertEqual(first.local_stats(), {"entries": 0, "bytes": 0})
+        self.assertIsNone(first.get("key"))
+        # the token went with the value, the other worker refetches
+        self.clock.return_value += 1
+        self.assertIsNone(second.get("key"))
+
+    def test_get_or_set(self):
+        cache = self.make_cache()
+        compute = mock.Mock(return_value=[1, 2])
+        self.assertEqual(cache.get_or_set("key", compute), [1, 2])
+        self.assertEqual(cache.get_or_set("key", compute), [1, 2])
+        compute.assert_called_once()
+        # a stored None is a value too
+        self.assertIsNone(cache.get_or_set("none", None))
+        self.assertIsNone(cache.get_or_set("none", 1))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from carts.models import Cart
+from carts.models import Cart, Reservation
 
 # admin.site.register(Cart)
 class CartTabAdmin(admin.TabularInline):
@@ -29,6 +29,8 @@ class CartAdmin(admin.ModelAdmin):
     product_display.short_description = "Товар"
 
 
-
-
-    
\ No newline at end of file
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ["product", "quantity", "expires_at", "cart_id"]
+    list_filter = ["expires_at"]
+    list_select_related = ["product"]
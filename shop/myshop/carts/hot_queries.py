@@ -0,0 +1,31 @@
+from django.utils import timezone
+
+from carts.models import Cart, Reservation
+from common.explain import hot_query
+
+
+@hot_query("cart:user")
+def user_carts():
+    return Cart.objects.filter(user_id=1).select_related("product")
+
+
+@hot_query("cart:session")
+def session_carts():
+    return Cart.objects.filter(session_key="x" * 32).select_related("product")
+
+
+@hot_query("cart:user+product")
+def user_product_cart():
+    return Cart.objects.filter(user_id=1, product_id=1)
+
+
+@hot_query("cart:release_reservations batch")
+def expired_reservations():
+    # the batch of release_reservations, walks the primary key
+    return Reservation.objects.expired().filter(id__gt=0).order_by("id").values_list("id", flat=True)[:500]
+
+
+@hot_query("cart:clear_anonymous_carts chunk")
+def abandoned_carts():
+    # a window of clear_anonymous_carts, walks the primary key
+    return Cart.objects.abandoned(timezone.now()).filter(id__gt=0, id__lte=1000)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from carts.models import Reservation
+
+
+class Command(BaseCommand):
+    help = "Снимает просроченные резервы товаров пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total, last_id = 0, 0
+
+        # short transactions by id ranges, so checkout is never blocked for long
+        while True:
+            ids = list(
+                Reservation.objects.expired()
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            total += Reservation.objects.expired().filter(id__in=ids).release()
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Снято резервов: {total}"))
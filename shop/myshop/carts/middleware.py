@@ -0,0 +1,16 @@
+from carts.utils import CookieCart
+
+
+class CookieCartMiddleware:
+    # writes the anonymous cookie cart (carts.utils.CookieCart) back to the
+    # response if the request changed it
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cookie_cart = getattr(request, "_cookie_cart", None)
+        if cookie_cart is not None:
+            cookie_cart.save(response)
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model("carts", "Cart")
+
+    for owner in ("user", "session_key"):
+        duplicates = (
+            Cart.objects.filter(**{f"{owner}__isnull": False})
+            .values(owner, "product")
+            .annotate(lines=Count("id"), total=Sum("quantity"), keep=Min("id"))
+            .filter(lines__gt=1)
+        )
+        for row in duplicates:
+            Cart.objects.filter(id=row["keep"]).update(quantity=row["total"])
+            Cart.objects.filter(**{owner: row[owner], "product": row["product"]}).exclude(
+                id=row["keep"]
+            ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0002_initial'),
+        ('goods', '0003_products_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'product'), name='cart_unique_user_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('session_key__isnull', False)), fields=('session_key', 'product'), name='cart_unique_session_product'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0003_cart_unique_owner_product'),
+        ('goods', '0004_products_reserved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('cart', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reservation', to='carts.cart', verbose_name='Корзина')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='goods.products', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Резерв',
+                'verbose_name_plural': 'Резервы',
+                'db_table': 'cart_reservation',
+                'ordering': ('id',),
+            },
+        ),
+    ]
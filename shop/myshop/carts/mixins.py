@@ -1,9 +1,10 @@
 
 
+from django.http import JsonResponse
 from django.template.loader import render_to_string
 from django.urls import reverse
 from carts.models import Cart
-from carts.utils import get_user_carts
+from carts.utils import get_cart_summary
 
 
 class CartMixin:
@@ -11,8 +12,11 @@ class CartMixin:
 
         if request.user.is_authenticated:
             query_kwargs = {"user": request.user}
-        else:
+        elif request.session.session_key:
             query_kwargs = {"session_key": request.session.session_key}
+        else:
+            # session_key=None would match the carts of users
+            return None
 
         if product:
             query_kwargs["product"] = product
@@ -22,14 +26,28 @@ class CartMixin:
         return Cart.objects.filter(**query_kwargs).first()
     
     def render_cart(self, request):
-        user_cart = get_user_carts(request)
-        context = {"carts": user_cart}
+        context = {"carts": get_cart_summary(request)}
 
         # if referer page is create_order add key orders: True to context
-        referer = request.META.get('HTTP_REFERER')
+        referer = request.META.get('HTTP_REFERER', '')
         if reverse('orders:create_order') in referer:
             context["order"] = True
 
         return render_to_string(
             "carts/includes/included_cart.html", context, request=request
-        )
\ No newline at end of file
+        )
+
+    def cart_response(self, request, message, **data):
+        return JsonResponse({
+            "message": message,
+            **data,
+            "cart_items_html": self.render_cart(request),
+        })
+
+    def out_of_stock(self, request):
+        # 409 with the unchanged cart, so the page can roll its counters back
+        response_data = {
+            "message": "Недостаточно товара на складе",
+            "cart_items_html": self.render_cart(request),
+        }
+        return JsonResponse(response_data, status=409)
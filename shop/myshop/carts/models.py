@@ -1,9 +1,28 @@
-from django.db import models
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import (
+    Case, DecimalField, Exists, ExpressionWrapper, F, OuterRef, PositiveIntegerField, Q, Sum, Value,
+    When, Window,
+)
+from django.db.models.functions import Greatest, Round
+from django.utils import timezone
 from goods.models import Products
 
 from users.models import User
 
 
+# session engines that keep the sessions in the django_session table
+DB_SESSION_ENGINES = ("django.contrib.sessions.backends.db", "django.contrib.sessions.backends.cached_db")
+
+# result of CartQueryset.merge_into: lines added or raised, and the lines of
+# the anonymous cart left out because no stock is left for them
+MergedCart = namedtuple("MergedCart", ["merged", "dropped"])
+
+
 class CartQueryset(models.QuerySet):
     
     def total_price(self):
@@ -13,8 +32,209 @@ class CartQueryset(models.QuerySet):
         if self:
             return sum(cart.quantity for cart in self)
         return 0
+
+    def with_totals(self):
+        # Cart.products_price() and the grand totals (window sums) done by the
+        # database on the stored Products.sell_price
+        money = DecimalField(max_digits=12, decimal_places=2)
+        sell_price = F("product__sell_price")
+        products_price = Round(
+            ExpressionWrapper(sell_price * F("quantity"), output_field=money), 2, output_field=money
+        )
+
+        return self.annotate(
+            product_name=F("product__name"),
+            sell_price=sell_price,
+            products_price=products_price,
+            cart_total_quantity=Window(Sum("quantity")),
+            cart_total_price=Window(Sum(products_price), output_field=money),
+        )
     
 
+    def abandoned(self, created_before):
+        # anonymous lines whose session is gone or expired, or just too old;
+        # with cache or cookie sessions django_session is empty and tells
+        # nothing, the age is all there is
+        anonymous = self.filter(user=None, session_key__isnull=False)
+        if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+            return anonymous.filter(created_timestamp__lt=created_before)
+
+        live_session = Exists(
+            Session.objects.filter(session_key=OuterRef("session_key"), expire_date__gt=timezone.now())
+        )
+        return anonymous.filter(Q(created_timestamp__lt=created_before) | ~live_session)
+
+    def add_product(self, product_id, user=None, session_key=None, quantity=1):
+        # INSERT or quantity + N in one statement, relies on the unique
+        # (owner, product) constraints of Cart
+        owner_field = "user_id" if user else "session_key"
+        owner = user.pk if user else session_key
+        connection = connections[self.db]
+
+        if not connection.features.supports_update_conflicts_with_target:
+            return self._add_product_fallback(owner_field, owner, product_id, quantity)
+
+        qn = connection.ops.quote_name
+        table, owner_column = qn(self.model._meta.db_table), qn(owner_field)
+        products_table = qn(Products._meta.db_table)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        # INSERT ... SELECT inserts nothing for an unknown product, so the
+        # row count tells whether the product exists
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({owner_column}, product_id, quantity, created_timestamp) "
+                f"SELECT %s, id, %s, %s FROM {products_table} WHERE id = %s "
+                f"ON CONFLICT ({owner_column}, product_id) WHERE {owner_column} IS NOT NULL "
+                f"DO UPDATE SET quantity = {table}.quantity + excluded.quantity",
+                [owner, quantity, now, product_id],
+            )
+            return cursor.rowcount
+
+    def _add_product_fallback(self, owner_field, owner, product_id, quantity):
+        lookup = {owner_field: owner, "product_id": product_id}
+        if self.filter(**lookup).update(quantity=F("quantity") + quantity):
+            return 1
+        if not Products.objects.filter(id=product_id).exists():
+            return 0
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(quantity=quantity, **lookup)
+        except IntegrityError:
+            # a concurrent request has inserted the row in the meantime
+            return self.filter(**lookup).update(quantity=F("quantity") + quantity)
+        return 1
+
+
+    def merge_into(self, user, session_key=None, lines=None):
+        # Adds an anonymous cart - the Cart rows of session_key and/or the
+        # {product_id: quantity} lines of a cookie cart - to the user's cart:
+        # one INSERT ... SELECT sums the quantities per product and upserts
+        # them, clamped to the stock that isn't held by other carts (the
+        # user's own hold counts as available). A line is never lowered
+        # below what the user already had. Constant number of queries
+        # whatever the size of the carts, apart from the holds with
+        # CART_RESERVATION_TTL on: one per line the merge has raised.
+        connection = connections[self.db]
+        if not connection.features.supports_update_conflicts_with_target:
+            return self._merge_into_fallback(user, session_key, lines)
+
+        sources = []
+        if session_key:
+            sources.append((
+                f"SELECT product_id, quantity FROM {connection.ops.quote_name(self.model._meta.db_table)} "
+                f"WHERE session_key = %s",
+                [session_key],
+            ))
+        for product_id, quantity in (lines or {}).items():
+            sources.append(("SELECT %s AS product_id, %s AS quantity", [product_id, quantity]))
+        if not sources:
+            return MergedCart(0, 0)
+
+        ttl = settings.CART_RESERVATION_TTL
+        with transaction.atomic(using=self.db):
+            if session_key:
+                # anonymous holds go back to the stock first, the merged
+                # lines are checked against it below
+                Reservation.objects.using(self.db).filter(cart__session_key=session_key).release()
+
+            before = self._line_quantities(user) if ttl else None
+            merged = self._merge_rows(connection, user, sources)
+            if ttl:
+                self._hold_merged(user, before, ttl)
+
+            # a cookie cart and session rows never have the same product:
+            # the cookie is emptied when its lines move to the session
+            anonymous = len(lines or ())
+            if session_key:
+                anonymous += self.filter(session_key=session_key).delete()[0]
+        return MergedCart(merged, anonymous - merged)
+
+    def _merge_rows(self, connection, user, sources):
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        products_table = qn(Products._meta.db_table)
+        reservations_table = qn(Reservation._meta.db_table)
+        least, greatest = ("MIN", "MAX") if connection.vendor == "sqlite" else ("LEAST", "GREATEST")
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        source_sql = " UNION ALL ".join(sql for sql, params in sources)
+        source_params = [param for sql, params in sources for param in params]
+
+        had = "COALESCE(u.quantity, 0)"
+        available = "p.quantity - p.reserved + COALESCE(r.quantity, 0)"
+        merged = f"{least}({had} + a.quantity, {greatest}({available}, {had}), 32767)"
+
+        # the WHERE also keeps SQLite from reading ON CONFLICT as a join constraint
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, product_id, quantity, created_timestamp) "
+                f"SELECT %s, p.id, {merged}, %s "
+                f"FROM (SELECT product_id, SUM(quantity) AS quantity FROM ({source_sql}) s GROUP BY product_id) a "
+                f"INNER JOIN {products_table} p ON p.id = a.product_id "
+                f"LEFT JOIN {table} u ON u.user_id = %s AND u.product_id = a.product_id "
+                f"LEFT JOIN {reservations_table} r ON r.cart_id = u.id "
+                f"WHERE {merged} > 0 "
+                f"ON CONFLICT (user_id, product_id) WHERE user_id IS NOT NULL "
+                f"DO UPDATE SET quantity = excluded.quantity",
+                [user.pk, now, *source_params, user.pk],
+            )
+            return cursor.rowcount
+
+    def _line_quantities(self, user):
+        return dict(self.filter(user=user).values_list("product_id", "quantity"))
+
+    def _hold_merged(self, user, before, ttl):
+        # the user's lines are held for what the merge has added to them, as
+        # if it was added to the cart; stock taken by another cart in the
+        # meantime leaves the rest unheld, checkout checks the stock anyway
+        for cart in self.filter(user=user).only("id", "product_id", "quantity"):
+            added = cart.quantity - before.get(cart.product_id, 0)
+            if added > 0:
+                Reservation.objects.using(self.db).hold(cart, added, ttl)
+
+    def _merge_into_fallback(self, user, session_key, lines):
+        quantities = Counter(lines or {})
+        if session_key:
+            quantities.update(dict(self.filter(session_key=session_key).values_list("product_id", "quantity")))
+        if not quantities:
+            return MergedCart(0, 0)
+
+        ttl = settings.CART_RESERVATION_TTL
+        with transaction.atomic(using=self.db):
+            if session_key:
+                Reservation.objects.using(self.db).filter(cart__session_key=session_key).release()
+            before = self._line_quantities(user) if ttl else None
+
+            products = Products.objects.select_for_update().in_bulk(quantities)
+            carts = {
+                cart.product_id: cart
+                for cart in self.filter(user=user, product_id__in=quantities).select_related("reservation")
+            }
+            merged = 0
+            for product_id, quantity in quantities.items():
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                cart = carts.get(product_id)
+                had = cart.quantity if cart else 0
+                held = cart.reservation.quantity if cart and hasattr(cart, "reservation") else 0
+                total = min(had + quantity, max(product.quantity - product.reserved + held, had), 32767)
+                if total <= 0:
+                    continue
+                if cart:
+                    self.filter(id=cart.id).update(quantity=total)
+                else:
+                    self.create(user=user, product_id=product_id, quantity=total)
+                merged += 1
+
+            if ttl:
+                self._hold_merged(user, before, ttl)
+            if session_key:
+                self.filter(session_key=session_key).delete()
+        return MergedCart(merged, len(quantities) - merged)
+
+
 class Cart(models.Model):
 
     user = models.ForeignKey(to=User, on_delete=models.CASCADE, blank=True, null=True, verbose_name='Пользователь')
@@ -28,11 +248,23 @@ class Cart(models.Model):
         verbose_name = "Корзина"
         verbose_name_plural = "Корзина"
         ordering = ("id",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"],
+                condition=Q(user__isnull=False),
+                name="cart_unique_user_product",
+            ),
+            models.UniqueConstraint(
+                fields=["session_key", "product"],
+                condition=Q(session_key__isnull=False),
+                name="cart_unique_session_product",
+            ),
+        ]
 
     objects = CartQueryset().as_manager()
 
     def products_price(self):
-        return round(self.product.sell_price() * self.quantity, 2)
+        return round(self.product.sell_price * self.quantity, 2)
 
 
     def __str__(self):
@@ -41,3 +273,70 @@ class Cart(models.Model):
             
         return f'Анонимная корзина | Товар {self.product.name} | Количество {self.quantity}'
 
+
+
+class ReservationQueryset(models.QuerySet):
+
+    def hold(self, cart, quantity, ttl):
+        # adds `quantity` to the hold of a cart line for `ttl` seconds; the
+        # conditional UPDATE of the counter is the whole stock check, the
+        # product row is neither read nor locked
+        with transaction.atomic(using=self.db):
+            held = Products.objects.filter(
+                id=cart.product_id, quantity__gte=F("reserved") + quantity
+            ).update(reserved=F("reserved") + quantity)
+            if not held:
+                return False
+
+            expires_at = timezone.now() + timedelta(seconds=ttl)
+            if not self.filter(cart_id=cart.id).update(quantity=F("quantity") + quantity, expires_at=expires_at):
+                self.create(cart_id=cart.id, product_id=cart.product_id, quantity=quantity, expires_at=expires_at)
+        return True
+
+    def expired(self):
+        # a hold whose cart line is gone is as good as expired
+        cart_exists = Exists(Cart.objects.filter(id=OuterRef("cart_id")))
+        return self.filter(Q(expires_at__lte=timezone.now()) | ~cart_exists)
+
+    def release(self):
+        # gives the held quantity back to the products, one UPDATE for all of them
+        with transaction.atomic(using=self.db):
+            rows = list(self.select_for_update().values_list("id", "product_id", "quantity"))
+            if not rows:
+                return 0
+
+            held = Counter()
+            for reservation_id, product_id, quantity in rows:
+                held[product_id] += quantity
+
+            amount = Case(
+                *[When(id=product_id, then=Value(quantity)) for product_id, quantity in held.items()],
+                output_field=PositiveIntegerField(),
+            )
+            Products.objects.filter(id__in=held).update(reserved=Greatest(F("reserved") - amount, 0))
+            self.model.objects.filter(id__in=[row[0] for row in rows]).delete()
+        return len(rows)
+
+
+class Reservation(models.Model):
+
+    # DO_NOTHING keeps deleting carts a single DELETE; the views release the
+    # hold first, one left without its cart line is released by the sweep
+    cart = models.OneToOneField(
+        to=Cart, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='reservation', verbose_name='Корзина',
+    )
+    product = models.ForeignKey(to=Products, on_delete=models.CASCADE, verbose_name='Товар')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='Количество')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Действует до')
+
+    class Meta:
+        db_table = 'cart_reservation'
+        verbose_name = "Резерв"
+        verbose_name_plural = "Резервы"
+        ordering = ("id",)
+
+    objects = ReservationQueryset().as_manager()
+
+    def __str__(self):
+        return f'Резерв | Товар {self.product_id} | Количество {self.quantity} | До {self.expires_at}'
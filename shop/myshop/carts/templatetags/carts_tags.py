@@ -1,7 +1,6 @@
 from django import template
 
-from carts.models import Cart
-from carts.utils import get_user_carts
+from carts.utils import get_cart_summary
 
 
 register = template.Library()
@@ -9,4 +8,4 @@ register = template.Library()
 
 @register.simple_tag()
 def user_carts(request):
-    return get_user_carts(request)
\ No newline at end of file
+    return get_cart_summary(request)
\ No newline at end of file
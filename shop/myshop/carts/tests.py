@@ -1,3 +1,408 @@
-from django.test import TestCase
+import math
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from carts.models import Cart, Reservation
+from common.mixins import PAGE_CSRF_STUB
+from common.testing import QueryBudgetMixin
+from goods.models import Products
+from users.models import User
+
+
+class AbandonedCartsTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        session = SessionStore()
+        session.create()
+        first, second = Products.objects.all()[:2]
+        self.live = Cart.objects.create(product=first, quantity=1, session_key=session.session_key)
+        self.expired = Cart.objects.create(product=first, quantity=1, session_key="x" * 32)
+        self.old = Cart.objects.create(product=second, quantity=1, session_key=session.session_key)
+        Cart.objects.filter(pk=self.old.pk).update(created_timestamp=timezone.now() - timedelta(days=60))
+
+    def abandoned(self):
+        return set(Cart.objects.abandoned(timezone.now() - timedelta(days=30)).values_list("pk", flat=True))
+
+    def test_db_sessions(self):
+        self.assertEqual(self.abandoned(), {self.expired.pk, self.old.pk})
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cache")
+    def test_cache_sessions_by_age_only(self):
+        # django_session says nothing about these sessions
+        self.assertEqual(self.abandoned(), {self.old.pk})
+
+
+class ClearAnonymousCartsTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        self.session = SessionStore()
+        self.session.create()
+        Products.objects.update(quantity=10)
+        # every third row belongs to a live session
+        self.carts = [
+            Cart.objects.create(
+                product_id=index + 1, quantity=1,
+                session_key=self.session.session_key if index % 3 == 0 else f"{index:032d}",
+            )
+            for index in range(7)
+        ]
+        self.live = {cart.pk for index, cart in enumerate(self.carts) if index % 3 == 0}
+        self.user_cart = Cart.objects.create(
+            user=User.objects.create_user("user", password="password"), product_id=1, quantity=1
+        )
+
+    def reserved(self):
+        return dict(Products.objects.filter(reserved__gt=0).values_list("pk", "reserved"))
+
+    def clear(self, *args):
+        out = StringIO()
+        call_command("clear_anonymous_carts", "--verbosity", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_batches(self):
+        start = self.carts[0].pk - 1
+        out = self.clear("--batch-size", "2", "--start-id", str(start), "--skip-sessions")
+        self.assertEqual(set(Cart.objects.values_list("pk", flat=True)), self.live | {self.user_cart.pk})
+        # one line per id window, up to the last id
+        progress = [line for line in out.splitlines() if line.startswith("корзины:")]
+        self.assertEqual(len(progress), math.ceil((self.user_cart.pk - start) / 2))
+        self.assertIn(f"до id {self.user_cart.pk} из {self.user_cart.pk}, удалено 4", progress[-1])
+        self.assertIn("Удалено строк корзин: 4, сессий: 0", out)
+
+    def test_start_id(self):
+        # resumed after the fourth row: the rows before it are not looked at
+        self.clear("--start-id", str(self.carts[3].pk), "--skip-sessions")
+        self.assertEqual(
+            set(Cart.objects.values_list("pk", flat=True)),
+            {cart.pk for cart in self.carts[:4]} | self.live | {self.user_cart.pk},
+        )
+
+    @override_settings(CART_RESERVATION_TTL=900)
+    def test_holds_released(self):
+        for cart in [*self.carts, self.user_cart]:
+            Reservation.objects.hold(cart, 1, 900)
+        self.assertEqual(self.reserved(), {1: 2, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1})
+
+        self.clear("--batch-size", "3", "--skip-sessions")
+        # Reservation.cart has no FK constraint: the holds of the deleted
+        # rows are given back, not left behind
+        self.assertEqual(
+            set(Reservation.objects.values_list("cart_id", flat=True)), self.live | {self.user_cart.pk}
+        )
+        self.assertEqual(self.reserved(), {1: 2, 4: 1, 7: 1})
+
+    def test_sessions(self):
+        expired = SessionStore()
+        expired.create()
+        Session.objects.filter(pk=expired.session_key).update(expire_date=timezone.now() - timedelta(days=1))
+        out = self.clear("--batch-size", "1")
+        self.assertIn("сессий: 1", out)
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), [self.session.session_key])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.products = list(Products.objects.all()[:4])
+
+    def fill_cart(self):
+        for product in self.products:
+            self.assertWithinBudget("cart:cart_add", data={"product_id": product.id}, method="post")
+        # again: quantity + 1 of an existing line
+        self.assertWithinBudget("cart:cart_add", data={"product_id": self.products[0].id}, method="post")
+
+    def change_and_remove(self, carts):
+        self.assertWithinBudget("cart:cart_fragment")
+        first, second = carts[:2]
+        self.assertWithinBudget("cart:cart_change", data={"cart_id": first.id, "quantity": 3}, method="post")
+        self.assertWithinBudget("cart:cart_remove", data={"cart_id": second.id}, method="post")
+        self.assertWithinBudget("cart:cart_fragment")
+
+    def test_anonymous(self):
+        # the first product creates the session
+        self.assertWithinBudget("cart:cart_fragment")
+        self.fill_cart()
+        self.change_and_remove(Cart.objects.filter(session_key=self.client.session.session_key))
+
+    def test_user(self):
+        user = User.objects.create_user("user", password="password")
+        self.client.force_login(user)
+        self.fill_cart()
+        self.change_and_remove(Cart.objects.filter(user=user))
+
+    @override_settings(CART_RESERVATION_TTL=900)
+    def test_user_with_holds(self):
+        user = User.objects.create_user("user", password="password")
+        self.client.force_login(user)
+        self.fill_cart()
+        self.change_and_remove(Cart.objects.filter(user=user))
+
+
+class CartFragmentTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def test_session_cart(self):
+        self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+        self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+        response = self.client.get(reverse("cart:cart_fragment"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        data = response.json()
+        self.assertIn('<span id="goods-in-cart-count">2</span>', data["cart_html"])
+        self.assertNotIn('id="cart-fragment"', data["cart_html"])
+        # the real token for the forms of the cached page
+        self.assertTrue(data["csrf_token"])
+        self.assertNotEqual(data["csrf_token"], PAGE_CSRF_STUB)
+
+    def test_empty(self):
+        data = self.client.get(reverse("cart:cart_fragment")).json()
+        self.assertIn('<span id="goods-in-cart-count">0</span>', data["cart_html"])
+
+
+@override_settings(CART_RESERVATION_TTL=900)
+class ReservationTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", password="password")
+        self.client.force_login(self.user)
+        Products.objects.filter(pk=1).update(quantity=5)
+
+    def stock(self):
+        return Products.objects.values_list("quantity", "reserved").get(pk=1)
+
+    def add(self):
+        return self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+
+    def change(self, quantity):
+        cart = Cart.objects.get(user=self.user)
+        return self.client.post(reverse("cart:cart_change"), {"cart_id": cart.id, "quantity": quantity})
+
+    def test_hold(self):
+        self.add()
+        self.add()
+        self.assertEqual(self.stock(), (5, 2))
+        reservation = Reservation.objects.get()
+        self.assertEqual((reservation.cart.quantity, reservation.quantity), (2, 2))
+        self.assertGreater(reservation.expires_at, timezone.now())
+
+        # the hold follows the new quantity
+        self.assertEqual(self.change(4).status_code, 200)
+        self.assertEqual(self.stock(), (5, 4))
+        self.assertEqual(Reservation.objects.get().quantity, 4)
+
+    def test_out_of_stock(self):
+        # the other 3 are held by another cart
+        Products.objects.filter(pk=1).update(reserved=3)
+        self.add()
+        self.add()
+        response = self.add()
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("cart_items_html", response.json())
+        # rolled back: neither the line nor the hold has grown
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 2)
+        self.assertEqual(self.stock(), (5, 5))
+
+        self.assertEqual(self.change(3).status_code, 409)
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 2)
+        self.assertEqual(Reservation.objects.get().quantity, 2)
+
+    def test_bad_quantity(self):
+        self.add()
+        for quantity in ("", "abc", "1.5"):
+            self.assertEqual(self.change(quantity).status_code, 404)
+        self.assertEqual(self.client.post(reverse("cart:cart_change"), {"cart_id": 0, "quantity": 1}).status_code, 404)
+        # clamped to the range of the column, as in the cookie cart
+        self.assertEqual(self.change(-3).status_code, 200)
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 1)
+        self.assertEqual(self.stock(), (5, 1))
+
+    def test_release(self):
+        self.add()
+        self.add()
+        self.client.post(reverse("cart:cart_remove"), {"cart_id": Cart.objects.get(user=self.user).id})
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_sweep(self):
+        self.add()
+        self.add()
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        # another one whose cart line is gone
+        Products.objects.filter(pk=2).update(quantity=5)
+        self.client.post(reverse("cart:cart_add"), {"product_id": 2})
+        Cart.objects.filter(product_id=2).delete()
+        # and a live one
+        self.client.post(reverse("cart:cart_add"), {"product_id": 3})
+
+        out = StringIO()
+        call_command("release_reservations", "--batch-size", "1", stdout=out)
+        self.assertIn("Снято резервов: 2", out.getvalue())
+        self.assertEqual(self.stock(), (5, 0))
+        self.assertEqual(Products.objects.get(pk=2).reserved, 0)
+        self.assertEqual(list(Reservation.objects.values_list("product_id", flat=True)), [3])
+
+    def test_stale_product_save(self):
+        self.add()
+        product = Products.objects.get(pk=1)
+        self.add()
+        # a full save of an instance read before the hold keeps the counter
+        product.name = "Новое название"
+        product.save()
+        self.assertEqual(self.stock(), (5, 2))
+        self.assertEqual(Products.objects.get(pk=1).name, "Новое название")
+
+
+class MergeTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", password="password")
+        Products.objects.filter(pk__in=[1, 2, 3]).update(quantity=10)
+
+    def add(self, product_id, times=1):
+        for _ in range(times):
+            self.client.post(reverse("cart:cart_add"), {"product_id": product_id})
+
+    def login(self):
+        response = self.client.post(reverse("user:login"), {"username": "user", "password": "password"})
+        self.assertEqual(response.status_code, 302)
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def lines(self):
+        return dict(Cart.objects.filter(user=self.user).values_list("product_id", "quantity"))
+
+    def test_summed(self):
+        Cart.objects.create(user=self.user, product_id=1, quantity=2)
+        self.add(1, 3)
+        self.add(2)
+        self.login()
+        self.assertEqual(self.lines(), {1: 5, 2: 1})
+        self.assertFalse(Cart.objects.filter(user=None).exists())
+
+    def test_clamped(self):
+        Products.objects.filter(pk=1).update(quantity=4)
+        Products.objects.filter(pk=2).update(quantity=2)
+        Cart.objects.create(user=self.user, product_id=1, quantity=1)
+        # more than the stock already, it is not lowered
+        Cart.objects.create(user=self.user, product_id=2, quantity=3)
+        self.add(1, 5)
+        self.add(2)
+        self.login()
+        self.assertEqual(self.lines(), {1: 4, 2: 3})
+
+    def test_dropped(self):
+        Products.objects.filter(pk=2).update(quantity=0)
+        self.add(1)
+        self.add(2)
+        messages = self.login()
+        self.assertEqual(self.lines(), {1: 1})
+        self.assertIn("Товаров, которых нет в наличии, не добавлено в корзину: 1", messages)
+
+    @override_settings(CART_RESERVATION_TTL=900)
+    def test_own_hold(self):
+        Products.objects.filter(pk=1).update(quantity=3)
+        self.client.force_login(self.user)
+        self.add(1, 2)
+        self.client.logout()
+        self.add(1)
+        self.add(3)
+        self.assertEqual(Products.objects.get(pk=1).reserved, 3)
+
+        # the anonymous hold goes back to the stock, the user's own two
+        # count as available: 3 - 2 + 2
+        self.assertEqual(self.login(), ["user, Вы вошли в аккаунт"])
+        self.assertEqual(self.lines(), {1: 3, 3: 1})
+        # held for what the merge has added
+        self.assertEqual(dict(Products.objects.filter(pk__in=[1, 3]).values_list("id", "reserved")), {1: 3, 3: 1})
+        self.assertEqual(
+            dict(Reservation.objects.values_list("product_id", "quantity")), {1: 3, 3: 1}
+        )
+        self.assertFalse(Reservation.objects.filter(cart__user=None).exists())
+
+    @override_settings(ANONYMOUS_CART_STORAGE="cookie")
+    def test_cookie_lines(self):
+        Products.objects.filter(pk=3).update(quantity=0)
+        Cart.objects.create(user=self.user, product_id=1, quantity=1)
+        self.add(1, 2)
+        self.add(2)
+        self.add(3)
+        self.assertFalse(Cart.objects.filter(user=None).exists())
+
+        messages = self.login()
+        self.assertEqual(self.lines(), {1: 3, 2: 1})
+        self.assertIn("Товаров, которых нет в наличии, не добавлено в корзину: 1", messages)
+        self.assertEqual(self.client.cookies["cart"].value, "")
+
+
+class MergeFallbackTests(MergeTests):
+    # databases without INSERT ... ON CONFLICT (target) DO UPDATE
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(connection.features, "supports_update_conflicts_with_target", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class AddProductTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def add(self, product_id):
+        return self.client.post(reverse("cart:cart_add"), {"product_id": product_id})
+
+    def test_user(self):
+        user = User.objects.create_user("user", password="password")
+        self.client.force_login(user)
+        for _ in range(3):
+            self.assertEqual(self.add(1).status_code, 200)
+        self.add(2)
+        self.assertEqual(
+            list(Cart.objects.filter(user=user).values_list("product_id", "quantity")), [(1, 3), (2, 1)]
+        )
+
+    def test_session(self):
+        self.add(1)
+        self.add(1)
+        session_key = self.client.session.session_key
+        self.assertEqual(list(Cart.objects.values_list("session_key", "product_id", "quantity")), [(session_key, 1, 2)])
+
+    def test_unknown_product(self):
+        self.assertEqual(self.add(999999).status_code, 404)
+        self.assertEqual(self.add("abc").status_code, 404)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_queryset(self):
+        user = User.objects.create_user("user", password="password")
+        self.assertEqual(Cart.objects.add_product(1, user=user, quantity=2), 1)
+        self.assertEqual(Cart.objects.add_product(1, user=user), 1)
+        self.assertEqual(Cart.objects.add_product(999999, user=user), 0)
+        self.assertEqual(Cart.objects.add_product(1, session_key="s" * 32), 1)
+        self.assertEqual(
+            list(Cart.objects.values_list("user_id", "session_key", "product_id", "quantity")),
+            [(user.pk, None, 1, 3), (None, "s" * 32, 1, 1)],
+        )
+
+
+class AddProductFallbackTests(AddProductTests):
+    # databases without INSERT ... ON CONFLICT (target) DO UPDATE
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(connection.features, "supports_update_conflicts_with_target", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
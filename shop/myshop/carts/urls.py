@@ -8,4 +8,5 @@ urlpatterns = [
     path('cart_add/', views.CartAddView.as_view(), name='cart_add'),
     path('cart_change/', views.CartChangeView.as_view(), name='cart_change'),
     path('cart_remove/', views.CartRemoveView.as_view(), name='cart_remove'),
+    path('cart_fragment/', views.CartFragmentView.as_view(), name='cart_fragment'),
 ]
\ No newline at end of file
@@ -1,10 +1,227 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib import messages
+from django.core import signing
+
 from carts.models import Cart
+from goods.models import Products
 
 
 def get_user_carts(request):
     if request.user.is_authenticated:
         return Cart.objects.filter(user=request.user).select_related('product')
-    
+
+    # no session is created just to look at an empty cart, CartAddView
+    # creates it with the first product
     if not request.session.session_key:
-        request.session.create()
-    return Cart.objects.filter(session_key=request.session.session_key).select_related('product')
\ No newline at end of file
+        return Cart.objects.none()
+    return Cart.objects.filter(session_key=request.session.session_key).select_related('product')
+
+
+@dataclass(frozen=True)
+class CartLine:
+    id: int
+    product_id: int
+    product_name: str
+    quantity: int
+    sell_price: Decimal
+    products_price: Decimal
+
+
+@dataclass(frozen=True)
+class CartSummary:
+    lines: tuple = ()
+    total_quantity: int = 0
+    total_price: Decimal = Decimal("0.00")
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def money(value):
+    return Decimal(value or 0).quantize(Decimal("0.01"))
+
+
+def get_cart_summary(request):
+    if uses_cookie_cart(request):
+        return CookieCart.get(request).summary()
+
+    # one query for the lines and the totals, the template only reads attributes
+    rows = list(
+        get_user_carts(request)
+        .select_related(None)
+        .with_totals()
+        .values(
+            "id", "product_id", "product_name", "quantity", "sell_price", "products_price",
+            "cart_total_quantity", "cart_total_price",
+        )
+    )
+    if not rows:
+        return CartSummary()
+
+    lines = tuple(
+        CartLine(
+            id=row["id"],
+            product_id=row["product_id"],
+            product_name=row["product_name"],
+            quantity=row["quantity"],
+            sell_price=money(row["sell_price"]),
+            products_price=money(row["products_price"]),
+        )
+        for row in rows
+    )
+    return CartSummary(lines, rows[0]["cart_total_quantity"], money(rows[0]["cart_total_price"]))
+
+
+# session flag: the anonymous cart outgrew the cookie and lives in Cart rows
+CART_IN_DB_SESSION_KEY = "cart_in_db"
+
+
+def uses_cookie_cart(request):
+    # ANONYMOUS_CART_STORAGE = "cookie": an anonymous cart of up to
+    # CART_COOKIE_MAX_LINES lines is kept in a signed cookie, with no session
+    # and no Cart rows; a bigger one moves to Cart rows of the session
+    return (
+        settings.ANONYMOUS_CART_STORAGE == "cookie"
+        and not request.user.is_authenticated
+        and not request.session.get(CART_IN_DB_SESSION_KEY)
+    )
+
+
+class CookieCart:
+    # {product_id: quantity} in a signed cookie; the lines are addressed by
+    # "p<product_id>" instead of a Cart id. Changes are written to the
+    # response by carts.middleware.CookieCartMiddleware.
+    salt = "carts.cookie_cart"
+
+    def __init__(self, request):
+        self.request = request
+        self.lines = self.load()
+        self.changed = False
+
+    @classmethod
+    def get(cls, request):
+        if not hasattr(request, "_cookie_cart"):
+            request._cookie_cart = cls(request)
+        return request._cookie_cart
+
+    def load(self):
+        raw = self.request.get_signed_cookie(
+            settings.CART_COOKIE_NAME, default="", salt=self.salt, max_age=settings.CART_COOKIE_AGE,
+        )
+        lines = {}
+        for item in raw.split(",") if raw else ():
+            try:
+                product_id, quantity = (int(value) for value in item.split(":"))
+            except ValueError:
+                return {}
+            if product_id > 0 and quantity > 0:
+                lines[product_id] = min(quantity, 32767)
+        return lines
+
+    def dumps(self):
+        return ",".join(f"{product_id}:{quantity}" for product_id, quantity in self.lines.items())
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                settings.CART_COOKIE_NAME, self.dumps(), salt=self.salt,
+                max_age=settings.CART_COOKIE_AGE, httponly=True, samesite="Lax",
+            )
+        else:
+            response.delete_cookie(settings.CART_COOKIE_NAME, samesite="Lax")
+
+    @staticmethod
+    def line_id(product_id):
+        return f"p{product_id}"
+
+    def product_id(self, line_id):
+        try:
+            product_id = int(str(line_id).removeprefix("p"))
+        except ValueError:
+            return None
+        return product_id if product_id in self.lines else None
+
+    def is_full(self, product_id):
+        return product_id not in self.lines and len(self.lines) >= settings.CART_COOKIE_MAX_LINES
+
+    def add(self, product_id, quantity=1):
+        self.lines[product_id] = min(self.lines.get(product_id, 0) + quantity, 32767)
+        self.changed = True
+
+    def change(self, product_id, quantity):
+        self.lines[product_id] = max(min(quantity, 32767), 1)
+        self.changed = True
+
+    def remove(self, product_id):
+        self.changed = True
+        return self.lines.pop(product_id, 0)
+
+    def clear(self):
+        self.changed = bool(self.lines) or self.changed
+        self.lines = {}
+
+    def summary(self):
+        if not self.lines:
+            return CartSummary()
+
+        products = {
+            product_id: (name, sell_price)
+            for product_id, name, sell_price in Products.objects.filter(id__in=self.lines).values_list(
+                "id", "name", "sell_price"
+            )
+        }
+        lines = tuple(
+            CartLine(
+                id=self.line_id(product_id),
+                product_id=product_id,
+                product_name=products[product_id][0],
+                quantity=quantity,
+                sell_price=money(products[product_id][1]),
+                products_price=money(products[product_id][1] * quantity),
+            )
+            for product_id, quantity in self.lines.items()
+            if product_id in products
+        )
+        return CartSummary(
+            lines,
+            sum(line.quantity for line in lines),
+            sum((line.products_price for line in lines), Decimal("0.00")),
+        )
+
+    def move_to_session(self):
+        # the cart outgrew the cookie: Cart rows of a new session from now on
+        session = self.request.session
+        if not session.session_key:
+            session.create()
+        session[CART_IN_DB_SESSION_KEY] = True
+        product_ids = Products.objects.filter(id__in=self.lines).values_list("id", flat=True)
+        Cart.objects.bulk_create([
+            Cart(session_key=session.session_key, product_id=product_id, quantity=self.lines[product_id])
+            for product_id in product_ids
+        ])
+        self.clear()
+
+
+def merge_anonymous_cart(request, user, session_key):
+    # on login/registration the anonymous cart (cookie lines and/or Cart rows
+    # of the old session) is added to the user's cart, see CartQueryset.merge_into
+    lines = None
+    if settings.ANONYMOUS_CART_STORAGE == "cookie":
+        cookie_cart = CookieCart.get(request)
+        lines = dict(cookie_cart.lines)
+        cookie_cart.clear()
+    result = Cart.objects.merge_into(user, session_key=session_key, lines=lines)
+    if result.dropped:
+        messages.warning(request, f"Товаров, которых нет в наличии, не добавлено в корзину: {result.dropped}")
+    return result
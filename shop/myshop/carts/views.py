@@ -1,72 +1,138 @@
-from django.http import JsonResponse
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import get_token
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import add_never_cache_headers
 from django.views import View
 from carts.mixins import CartMixin
-from carts.models import Cart
-from carts.utils import get_user_carts
+from carts.models import Cart, Reservation
+from carts.utils import CookieCart, get_user_carts, uses_cookie_cart
 
 from goods.models import Products
 
 
 class CartAddView(CartMixin, View):
     def post(self, request):
-        product_id = request.POST.get("product_id")
-        product = Products.objects.get(id=product_id)
-
-        cart = self.get_cart(request, product=product)
-
-        if cart:
-            cart.quantity += 1
-            cart.save()
+        try:
+            product_id = int(request.POST.get("product_id"))
+        except (TypeError, ValueError):
+            raise Http404("Товар не найден")
+
+        if uses_cookie_cart(request):
+            cookie_cart = CookieCart.get(request)
+            if not cookie_cart.is_full(product_id):
+                # no session and no rows, stock is checked at checkout
+                if not Products.objects.filter(id=product_id).exists():
+                    raise Http404("Товар не найден")
+                cookie_cart.add(product_id)
+                return self.cart_response(request, "Товар добавлен в корзину")
+            cookie_cart.move_to_session()
+
+        if request.user.is_authenticated:
+            owner = {"user": request.user}
         else:
-            Cart.objects.create(user=request.user if request.user.is_authenticated else None,
-                                session_key=request.session.session_key if not request.user.is_authenticated else None,
-                                product=product, quantity=1)
+            if not request.session.session_key:
+                request.session.create()
+            owner = {"session_key": request.session.session_key}
+
+        ttl = settings.CART_RESERVATION_TTL
+        with transaction.atomic() if ttl else nullcontext():
+            # one upsert instead of get product + get cart + save/create
+            if not Cart.objects.add_product(product_id, **owner):
+                raise Http404("Товар не найден")
+
+            held = not ttl or Reservation.objects.hold(self.get_cart(request, product=product_id), 1, ttl)
+            if not held:
+                transaction.set_rollback(True)
+
+        if not held:
+            return self.out_of_stock(request)
         
-        response_data = {
-            "message": "Товар добавлен в корзину",
-            'cart_items_html': self.render_cart(request)
-        }
-
-        return JsonResponse(response_data)
+        return self.cart_response(request, "Товар добавлен в корзину")
 
 
 class CartChangeView(CartMixin, View):
     def post(self, request):
         cart_id = request.POST.get("cart_id")
-        
+        try:
+            quantity = int(request.POST.get("quantity"))
+        except (TypeError, ValueError):
+            raise Http404("Товар не найден")
+        # the range of Cart.quantity
+        quantity = max(min(quantity, 32767), 1)
+
+        if uses_cookie_cart(request):
+            cookie_cart = CookieCart.get(request)
+            product_id = cookie_cart.product_id(cart_id)
+            if product_id is None:
+                raise Http404("Товар не найден")
+            cookie_cart.change(product_id, quantity)
+            return self.cart_response(
+                request, "Количество изменено", quantity=cookie_cart.lines[product_id]
+            )
+
         cart = self.get_cart(request, cart_id=cart_id)
+        if cart is None:
+            raise Http404("Товар не найден")
 
-        cart.quantity = request.POST.get("quantity")
-        cart.save()
+        ttl = settings.CART_RESERVATION_TTL
+        with transaction.atomic() if ttl else nullcontext():
+            cart.quantity = quantity
+            cart.save()
 
-        quantity = cart.quantity
+            # the hold follows the new quantity; without holds a leftover one
+            # simply expires
+            held = True
+            if ttl:
+                Reservation.objects.filter(cart=cart).release()
+                held = Reservation.objects.hold(cart, quantity, ttl)
+                if not held:
+                    transaction.set_rollback(True)
 
-        response_data = {
-            "message": "Количество изменено",
-            "quantity": quantity,
-            'cart_items_html': self.render_cart(request)
-        }
+        if not held:
+            return self.out_of_stock(request)
 
-        return JsonResponse(response_data)
+        return self.cart_response(request, "Количество изменено", quantity=cart.quantity)
 
 
 class CartRemoveView(CartMixin, View):
     def post(self, request):
         cart_id = request.POST.get("cart_id")
-        
-        cart = self.get_cart(request, cart_id=cart_id)
-        quantity = cart.quantity
-        cart.delete()
 
-        response_data = {
-            "message": "Товар удален из корзины",
-            "quantity_deleted": quantity,
-            'cart_items_html': self.render_cart(request)
-        }
+        if uses_cookie_cart(request):
+            cookie_cart = CookieCart.get(request)
+            product_id = cookie_cart.product_id(cart_id)
+            if product_id is None:
+                raise Http404("Товар не найден")
+            quantity = cookie_cart.remove(product_id)
+            return self.cart_response(request, "Товар удален из корзины", quantity_deleted=quantity)
 
-        return JsonResponse(response_data)
+        cart = self.get_cart(request, cart_id=cart_id)
+        if cart is None:
+            raise Http404("Товар не найден")
+        quantity = cart.quantity
+        if settings.CART_RESERVATION_TTL:
+            with transaction.atomic():
+                Reservation.objects.filter(cart=cart).release()
+                cart.delete()
+        else:
+            cart.delete()
+
+        return self.cart_response(request, "Товар удален из корзины", quantity_deleted=quantity)
+
+class CartFragmentView(View):
+    # the per-session part of pages from the page cache (common.mixins.PageCacheMixin)
+    def get(self, request):
+        response = JsonResponse({
+            "cart_html": render_to_string("includes/cart_button.html", request=request),
+            "csrf_token": get_token(request),
+        })
+        add_never_cache_headers(response)
+        return response
 
 # def cart_add(request):
 
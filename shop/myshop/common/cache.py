@@ -0,0 +1,92 @@
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+
+
+# Version counters never expire. If one gets evicted anyway it restarts from
+# the current time in ms, so it can't go back to a value that was used before.
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def incr_counter(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+# Entries of get_or_load(). The wrapper is never falsy, so an empty list or
+# None returned by a loader is cached like any other value.
+CacheEntry = namedtuple("CacheEntry", ["value", "expires_at", "delta"])
+
+
+def get_or_load(key, loader, timeout, metrics=None, beta=1.0, lock_timeout=10, wait=1.0):
+    # XFetch: each reader recomputes a little before the entry expires with
+    # a probability growing towards expiry and with the cost of the loader,
+    # so one request refreshes it while the others keep getting the value
+    entry = cache.get(key)
+    if isinstance(entry, CacheEntry):
+        early = entry.delta * beta * -math.log(1.0 - random.random())
+        if time.time() + early < entry.expires_at:
+            return _hit(metrics, entry.value)
+
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked:
+        # somebody is loading it already
+        if isinstance(entry, CacheEntry):
+            return _hit(metrics, entry.value)
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if isinstance(entry, CacheEntry):
+                return _hit(metrics, entry.value)
+
+    try:
+        started = time.perf_counter()
+        value = loader()
+        delta = time.perf_counter() - started
+        cache.set(key, CacheEntry(value, time.time() + timeout, delta), timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    if metrics:
+        incr_counter(f"{metrics}:misses")
+    return value
+
+
+def _hit(metrics, value):
+    if metrics:
+        incr_counter(f"{metrics}:hits")
+    return value
+
+
+def cache_stats(metrics):
+    hits = cache.get(f"{metrics}:hits", 0)
+    misses = cache.get(f"{metrics}:misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
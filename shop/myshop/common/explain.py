@@ -0,0 +1,39 @@
+import re
+from collections import namedtuple
+
+
+# Hot queries of the apps, registered in their hot_queries.py modules and
+# checked by `manage.py explain_hot_queries`. The function builds the
+# queryset with sample arguments, allow_scan lists tables a full scan of
+# which is fine (a handful of rows, or the query reads all of them anyway).
+HotQuery = namedtuple("HotQuery", ["name", "build", "allow_scan"])
+
+HOT_QUERIES = {}
+
+# SQLite: "SCAN product" without an index; "SCAN ... USING INDEX" walks an
+# index in order and is not a table scan. PostgreSQL: "Seq Scan on product"
+SQLITE_SCAN = re.compile(r"\bSCAN (?P<table>\w+)(?P<rest>.*)$")
+POSTGRES_SCAN = re.compile(r"\bSeq Scan on (?P<table>\w+)")
+
+
+def hot_query(name, allow_scan=()):
+    def decorator(build):
+        HOT_QUERIES[name] = HotQuery(name, build, frozenset(allow_scan))
+        return build
+
+    return decorator
+
+
+def find_scans(plan, vendor):
+    # tables read in full according to the EXPLAIN output
+    tables = []
+    for line in plan.splitlines():
+        if vendor == "postgresql":
+            match = POSTGRES_SCAN.search(line)
+            if match:
+                tables.append(match["table"])
+        else:
+            match = SQLITE_SCAN.search(line)
+            if match and "INDEX" not in match["rest"]:
+                tables.append(match["table"])
+    return tables
@@ -0,0 +1,27 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+def open_image(fieldfile):
+    # decoded and turned upright by its EXIF orientation; the EXIF itself
+    # (camera, GPS) is not written back by encode_image
+    with fieldfile.open("rb"):
+        image = Image.open(fieldfile)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    return image
+
+
+def encode_image(image, image_format, quality=80):
+    if image_format == "JPEG" and image.mode == "RGBA":
+        # no alpha in JPEG, transparent parts turn white
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
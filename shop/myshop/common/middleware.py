@@ -0,0 +1,156 @@
+import logging
+import re
+import time
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger("myshop.queries")
+
+# IN (%s, %s, ...) of any length is one shape
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+# transaction control of atomic(), not queries: BEGIN comes through the
+# cursor in autocommit mode only (not inside a TestCase), savepoints only
+# in a nested block, so counting them would make the budget of a request
+# depend on where it runs
+TRANSACTION_SQL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+def sql_shape(sql):
+    return IN_LIST.sub("IN (...)", sql)
+
+
+def stack_sample(limit=8):
+    # frames of the project, the innermost last; Django and libraries are skipped
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(root)
+        and "site-packages" not in frame.filename
+        and not frame.filename.endswith("manage.py")
+    ]
+    return "".join(traceback.format_list(frames[-limit:]))
+
+
+def get_query_budget(view_name):
+    # QUERY_BUDGETS plus the QUERY_BUDGET_EXTRAS of the settings that are
+    # on, e.g. {"CART_RESERVATION_TTL": {"cart:cart_add": 4}} for the holds
+    budget = getattr(settings, "QUERY_BUDGETS", {}).get(view_name)
+    if budget is None:
+        return None
+    for setting, extras in getattr(settings, "QUERY_BUDGET_EXTRAS", {}).items():
+        if getattr(settings, setting, None):
+            budget += extras.get(view_name, 0)
+    return budget
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryTracker:
+    # connection.execute_wrapper(): number, time and SQL shapes of the
+    # queries. A stack sample is taken for the first repeat of a shape (an
+    # N+1 is a shape repeated in a loop) and for the query over the budget.
+
+    def __init__(self, budget=None, duplicates=None):
+        self.budget = budget
+        self.duplicates = duplicates
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(TRANSACTION_SQL):
+            return execute(sql, params, many, context)
+
+        shape = sql_shape(sql)
+        self.count += 1
+        self.shapes[shape] += 1
+        if self.shapes[shape] == 2 and shape not in self.samples:
+            self.samples[shape] = stack_sample()
+        if self.budget is not None and self.count == self.budget + 1:
+            self.samples.setdefault("budget", stack_sample())
+
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+    def repeated(self):
+        limit = self.duplicates or 2
+        return {shape: count for shape, count in self.shapes.items() if count >= limit}
+
+    def problems(self):
+        problems = []
+        if self.budget is not None and self.count > self.budget:
+            sample = self.samples.get("budget", "")
+            problems.append(f"{self.count} запросов при бюджете {self.budget}\n{sample}")
+        if self.duplicates is not None:
+            for shape, count in self.repeated().items():
+                problems.append(f"{count} раз: {shape}\n{self.samples.get(shape, '')}")
+        return problems
+
+
+class QueryBudgetMiddleware:
+    # QUERY_BUDGETS = {"catalog:index": 4, ...} - queries per request by URL
+    # name (see get_query_budget); QUERY_DUPLICATES_LIMIT - how many times one SQL shape may repeat.
+    # Offenders are logged to "myshop.queries", with QUERY_BUDGET_STRICT
+    # (tests, CI) they raise QueryBudgetExceeded instead.
+    # QUERY_SERVER_TIMING adds Server-Timing: db, tpl (rendering without
+    # its queries) and total.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.duplicates = getattr(settings, "QUERY_DUPLICATES_LIMIT", None)
+        self.strict = getattr(settings, "QUERY_BUDGET_STRICT", False)
+        self.server_timing = getattr(settings, "QUERY_SERVER_TIMING", False)
+
+    def __call__(self, request):
+        tracker = request._query_tracker = QueryTracker(duplicates=self.duplicates)
+        started = time.perf_counter()
+        with connection.execute_wrapper(tracker):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        self.check(request, tracker)
+
+        if self.server_timing:
+            timings = [f"db;dur={tracker.duration * 1000:.1f};desc=\"{tracker.count} queries\""]
+            template = getattr(request, "_template_timing", None)
+            if template is not None:
+                timings.append(f"tpl;dur={template * 1000:.1f}")
+            timings.append(f"total;dur={total * 1000:.1f}")
+            response["Server-Timing"] = ", ".join(timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the budget is known once the URL is resolved
+        tracker = request._query_tracker
+        tracker.budget = get_query_budget(request.resolver_match.view_name)
+
+    def process_template_response(self, request, response):
+        tracker = request._query_tracker
+        started, db_before = time.perf_counter(), tracker.duration
+
+        def measure(response):
+            elapsed = time.perf_counter() - started
+            request._template_timing = elapsed - (tracker.duration - db_before)
+
+        response.add_post_render_callback(measure)
+        return response
+
+    def check(self, request, tracker):
+        problems = tracker.problems()
+        if not problems:
+            return
+        name = request.resolver_match.view_name if request.resolver_match else request.path
+        message = f"{request.method} {name}: " + "\n".join(problems)
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
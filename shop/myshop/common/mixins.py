@@ -1,12 +1,108 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
 from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
+
+from common.cache import incr_counter
+
+
+# prefix of the page cache hit/miss counters
+PAGE_METRICS = "page_cache"
+# {% csrf_token %} renders this in cached pages, the cart fragment request
+# brings the real token
+PAGE_CSRF_STUB = "page-cache"
+
+
+class PageCacheMixin:
+    # Pages that are the same for every anonymous visitor (GET, no pending
+    # messages). They have nothing of the session in them: the cart button
+    # is a placeholder the page fills from cart:cart_fragment, and so are the
+    # csrf tokens. The versions the page depends on give its ETag and the
+    # key in the full-page cache, bumping one of them purges the page.
+    page_cache_timeout = None
+    # GET parameters the page depends on; any others (utm tags, cache
+    # busters) get the same page and must not grow the cache
+    page_cache_params = ()
+
+    def get_page_cache_versions(self):
+        return ()
+
+    def get_page_last_modified(self):
+        return None
+
+    def get_page_cache_timeout(self):
+        if self.page_cache_timeout is not None:
+            return self.page_cache_timeout
+        return getattr(settings, "PAGE_CACHE_TIMEOUT", 0)
+
+    def get_page_digest(self):
+        versions = ":".join(str(version) for version in self.get_page_cache_versions())
+        params = urlencode([
+            (name, value)
+            for name in sorted(self.page_cache_params)
+            for value in self.request.GET.getlist(name)
+        ])
+        raw = f"{type(self).__name__}:{versions}:{self.request.path}?{params}"
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def use_page_cache(self, request):
+        return bool(
+            request.method in ("GET", "HEAD")
+            and not request.user.is_authenticated
+            # pending messages are rendered into the page
+            and not len(messages.get_messages(request))
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        self.page_cache = self.use_page_cache(request)
+        if not self.page_cache:
+            return super().dispatch(request, *args, **kwargs)
+
+        digest = self.get_page_digest()
+        etag = quote_etag(digest)
+        last_modified = self.get_page_last_modified()
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+
+        # 304 before anything is rendered or read from the cache
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_cached_page(request, f"page:{digest}", *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response.headers.setdefault("ETag", etag)
+            if last_modified and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def get_cached_page(self, request, key, *args, **kwargs):
+        timeout = self.get_page_cache_timeout()
+        if not timeout:
+            return super().dispatch(request, *args, **kwargs)
+
+        cached = cache.get(key)
+        if cached is not None:
+            incr_counter(f"{PAGE_METRICS}:hits")
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
 
+        incr_counter(f"{PAGE_METRICS}:misses")
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, "add_post_render_callback"):
 
-class CacheMixin:
-    def set_get_cache(self, query, cache_name, cache_time):
-        data = cache.get(cache_name)
+            def store(response):
+                cache.set(key, (response.content, response["Content-Type"]), timeout)
 
-        if not data:
-            data = query
-            cache.set(cache_name, data, cache_time)
+            response.add_post_render_callback(store)
+        return response
 
-        return data
\ No newline at end of file
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.page_cache:
+            context["page_cache"] = True
+            context["csrf_token"] = PAGE_CSRF_STUB
+        return context
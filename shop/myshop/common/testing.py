@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+
+from common.middleware import QueryTracker, get_query_budget
+
+
+@contextmanager
+def query_budget(max_queries=None, duplicates=2, using="default"):
+    # for tests: the block may run at most max_queries queries and repeat an
+    # SQL shape less than `duplicates` times (an N+1 repeats it per row)
+    tracker = QueryTracker(max_queries, duplicates)
+    with connections[using].execute_wrapper(tracker):
+        yield tracker
+    problems = tracker.problems()
+    if problems:
+        raise AssertionError("\n".join(problems))
+
+
+class TempMediaMixin:
+    # uploads and thumbnails of the test case go to a directory of its own
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        cls.media_root = media_root
+
+
+class QueryBudgetMixin:
+    # views requested within their QUERY_BUDGETS entry
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        super().setUp()
+        # cold caches, the worst case the budgets are set for
+        cache.clear()
+
+    def assertWithinBudget(self, view_name, args=(), data=None, method="get", status_code=200, client=None):
+        client = client or self.client
+        with query_budget(get_query_budget(view_name)):
+            response = getattr(client, method)(reverse(view_name, args=args), data)
+        self.assertEqual(response.status_code, status_code)
+        return response
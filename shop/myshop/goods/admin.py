@@ -14,7 +14,7 @@ class CategoriesAdmin(admin.ModelAdmin):
 @admin.register(Products)
 class ProductsAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("name",)}
-    list_display = ["name", "quantity", "price", "discount"]
+    list_display = ["name", "quantity", "reserved", "price", "discount", "sell_price"]
     list_editable = ["discount",]
     search_fields = ["name", "description"]
     list_filter = ["discount", "quantity", "category"]
@@ -24,6 +24,8 @@ class ProductsAdmin(admin.ModelAdmin):
         "slug",
         "description",
         "image",
-        ("price", "discount"),
-        "quantity",
+        ("price", "discount", "sell_price"),
+        ("quantity", "reserved"),
+        "updated_at",
     ]
+    readonly_fields = ["reserved", "sell_price", "updated_at"]
@@ -1,7 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class GoodsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goods'
     verbose_name = 'Товары'
+
+    def ready(self):
+        import goods.signals
+        post_migrate.connect(install_search_backend, sender=self)
+
+
+def install_search_backend(sender, using, **kwargs):
+    from goods.search import get_search_backend
+
+    get_search_backend(using).install(connections[using])
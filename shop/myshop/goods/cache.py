@@ -0,0 +1,153 @@
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+
+from common.cache import bump_version, cache_stats, get_or_load, get_version
+
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATEGORIES_VERSION_KEY = "catalog:categories:version"
+CATEGORIES_KEY = "catalog:categories"
+# one per product page, so an edit purges only that page from the page cache
+PRODUCT_VERSION_KEY = "catalog:product:{slug}:version"
+# prefix of the hit/miss counters
+RESULTS_METRICS = "catalog:results"
+# result sets longer than that are not worth keeping as a list of ids
+TOO_MANY_RESULTS = "too_many"
+
+CACHEABLE_ORDERINGS = ("default", "price", "-price")
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def get_categories_version():
+    return get_version(CATEGORIES_VERSION_KEY)
+
+
+def bump_categories_version():
+    return bump_version(CATEGORIES_VERSION_KEY)
+
+
+def get_product_version(slug):
+    return get_version(PRODUCT_VERSION_KEY.format(slug=slug))
+
+
+def bump_product_versions(slugs):
+    for slug in set(slugs):
+        if slug:
+            bump_version(PRODUCT_VERSION_KEY.format(slug=slug))
+
+
+CategoryItem = namedtuple("CategoryItem", ["id", "name", "slug"])
+
+# per-process copy of the categories, checked against the shared version
+_categories = {"version": None, "items": ()}
+
+
+def get_categories():
+    version = get_categories_version()
+    if _categories["version"] == version:
+        return _categories["items"]
+
+    def load():
+        from goods.models import Categories
+
+        return tuple(
+            CategoryItem(*row) for row in Categories.objects.values_list("id", "name", "slug")
+        )
+
+    items = get_or_load(
+        f"{CATEGORIES_KEY}:{version}", load,
+        getattr(settings, "CATEGORIES_CACHE_TIMEOUT", 60 * 60 * 24),
+    )
+
+    _categories.update(version=version, items=items)
+    return items
+
+
+def get_product_last_modified(slug):
+    # the product page shows the product and the categories menu; cached
+    # under both versions, so the validator costs no query
+    key = f"catalog:product:{slug}:last-modified:{get_product_version(slug)}:{get_categories_version()}"
+
+    def load():
+        from django.db.models import Subquery
+
+        from goods.models import Categories, Products
+
+        categories_updated_at = Categories.objects.order_by("-updated_at").values("updated_at")[:1]
+        row = (
+            Products.objects.filter(slug=slug)
+            .values_list("updated_at", Subquery(categories_updated_at))
+            .first()
+        )
+        return max(filter(None, row)) if row else None
+
+    return get_or_load(key, load, 60 * 60 * 24)
+
+
+def warm_up():
+    get_categories()
+
+
+def catalog_results_key(query, category_slug, on_sale, order_by):
+    query = " ".join((query or "").lower().split())
+    raw = f"{query}|{category_slug or ''}|{int(bool(on_sale))}|{order_by or 'default'}"
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"catalog:results:{get_catalog_version()}:{digest}"
+
+
+class CachedProductList:
+    # Sequence of products backed by a cached list of ids: len() needs no
+    # COUNT(*) and a slice (a page) is fetched by primary key.
+    ordered = True
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def exists(self):
+        return bool(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            products = self.queryset.in_bulk(ids)
+            return [products[pk] for pk in ids if pk in products]
+        return self[index:index + 1][0]
+
+
+def get_cached_results(queryset, query, category_slug, on_sale, order_by):
+    if (order_by or "default") not in CACHEABLE_ORDERINGS:
+        return queryset
+
+    max_ids = getattr(settings, "CATALOG_RESULTS_CACHE_MAX_IDS", 1000)
+    timeout = getattr(settings, "CATALOG_RESULTS_CACHE_TIMEOUT", 300)
+    key = catalog_results_key(query, category_slug, on_sale, order_by)
+
+    def load():
+        ids = list(queryset.values_list("id", flat=True)[:max_ids + 1])
+        return TOO_MANY_RESULTS if len(ids) > max_ids else ids
+
+    ids = get_or_load(key, load, timeout, metrics=RESULTS_METRICS)
+
+    if ids == TOO_MANY_RESULTS:
+        return queryset
+    return CachedProductList(ids, queryset.model._default_manager.all())
+
+
+def catalog_cache_stats():
+    return {"version": get_catalog_version(), **cache_stats(RESULTS_METRICS)}
@@ -0,0 +1,27 @@
+from common.explain import hot_query
+from goods.models import Products
+
+
+@hot_query("catalog:category")
+def catalog_category():
+    return Products.objects.filter(category__slug="kuhnya")[:3]
+
+
+@hot_query("catalog:category?order_by=price")
+def catalog_category_by_price():
+    return Products.objects.filter(category__slug="kuhnya").order_by("sell_price", "id")[:3]
+
+
+@hot_query("catalog:all?on_sale&order_by=price")
+def catalog_on_sale_by_price():
+    return Products.objects.filter(discount__gt=0).order_by("sell_price")[:3]
+
+
+@hot_query("catalog:all?order_by=-price (keyset)")
+def catalog_by_price_keyset():
+    return Products.objects.filter(sell_price__lt=100).order_by("-sell_price", "-id")[:4]
+
+
+@hot_query("catalog:product")
+def product():
+    return Products.objects.filter(slug="stol-1")
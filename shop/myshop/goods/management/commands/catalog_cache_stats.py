@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from goods.cache import catalog_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Выводит счетчики попаданий/промахов кэша результатов каталога (JSON)"
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(catalog_cache_stats()))
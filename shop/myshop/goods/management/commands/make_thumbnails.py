@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from goods.models import Products
+from goods.thumbnails import file_hash, make_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Хеширует изображения товаров и создает их миниатюры (WebP/JPEG по THUMBNAIL_WIDTHS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        products = Products.objects.exclude(image="").exclude(image=None).only("id", "image", "image_hash")
+        made, missing, hashed = 0, 0, []
+
+        for product in products.iterator(chunk_size=batch_size):
+            try:
+                if not product.image_hash:
+                    product.image_hash = file_hash(product.image)
+                    hashed.append(product)
+                make_thumbnails(product.image, product.image_hash)
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f"Нет файла: {product.image.name}")
+                continue
+            made += 1
+
+            if len(hashed) >= batch_size:
+                Products.objects.bulk_update(hashed, ["image_hash"])
+                hashed = []
+        if hashed:
+            Products.objects.bulk_update(hashed, ["image_hash"])
+
+        self.stdout.write(self.style.SUCCESS(f"Миниатюры готовы: {made}, без файла: {missing}"))
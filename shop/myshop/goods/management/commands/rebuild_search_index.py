@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from goods.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        backend = get_search_backend(using)
+        connection = connections[using]
+
+        backend.install(connection)
+        total = backend.rebuild(connection, batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{type(backend).__name__}: проиндексировано товаров: {total}"
+        ))
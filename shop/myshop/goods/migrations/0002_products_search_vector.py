@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:39
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The document is kept in sync by a trigger, so save(), queryset.update(),
+# bulk_create() and raw SQL all end up with an up to date search_vector.
+FORWARD_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector(coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector(coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON product
+    FOR EACH ROW EXECUTE FUNCTION product_search_vector_update();
+    """,
+    """
+    UPDATE product SET search_vector =
+        setweight(to_tsvector(coalesce(name, '')), 'A') ||
+        setweight(to_tsvector(coalesce(description, '')), 'B');
+    """,
+    "CREATE INDEX product_search_vector_idx ON product USING gin (search_vector);",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx;",
+    "DROP TRIGGER IF EXISTS product_search_vector_trigger ON product;",
+    "DROP FUNCTION IF EXISTS product_search_vector_update();",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgres(FORWARD_SQL), run_on_postgres(REVERSE_SQL)),
+    ]
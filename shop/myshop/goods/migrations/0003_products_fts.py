@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:41
+
+import django.db.models.deletion
+import goods.models
+from django.db import migrations, models
+
+
+# A copy of goods.search.SQLiteFTSSearchBackend.install_sql as of this
+# migration; the backend re-creates the triggers after every migrate, this
+# only builds the index of a fresh database.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    "INSERT INTO product_fts(product_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO product_fts(product_fts) VALUES('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS product_fts_ai",
+    "DROP TRIGGER IF EXISTS product_fts_ad",
+    "DROP TRIGGER IF EXISTS product_fts_au",
+    "DROP TABLE IF EXISTS product_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0002_products_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductsFTS',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='fts', serialize=False, to='goods.products')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', goods.models.FTSDocumentField(db_column='product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run_on_sqlite(FORWARD_SQL), run_on_sqlite(REVERSE_SQL)),
+    ]
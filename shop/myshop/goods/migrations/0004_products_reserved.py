@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_products_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Зарезервировано'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:58
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Round
+
+
+def fill_sell_price(apps, schema_editor):
+    Products = apps.get_model("goods", "Products")
+    price = F("price")
+    Products.objects.using(schema_editor.connection.alias).update(
+        sell_price=Round(
+            price - price * F("discount") * Value(Decimal("0.01")),
+            2,
+            output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_products_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='sell_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0.0, editable=False, max_digits=7, verbose_name='Цена со скидкой'),
+        ),
+        migrations.RunPython(fill_sell_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'sell_price'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['sell_price'], name='product_on_sale_price_idx'),
+        ),
+    ]
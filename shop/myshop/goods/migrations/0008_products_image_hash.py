@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0007_products_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Хеш изображения'),
+        ),
+    ]
@@ -1,10 +1,106 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import DecimalField, F, Q, Value
+from django.db.models.functions import Now, Round
 from django.urls import reverse
+from django.utils import timezone
+
+from goods.cache import bump_catalog_version, bump_categories_version, bump_product_versions
+
+
+# stock changes don't affect what the catalog lists, so they don't
+# invalidate cached catalog pages and search results
+STOCK_FIELDS = {"quantity", "reserved"}
+# Products.sell_price is derived from these
+SELL_PRICE_FIELDS = {"price", "discount"}
+
+
+def calculate_sell_price(price, discount):
+    price, discount = Decimal(str(price or 0)), Decimal(str(discount or 0))
+    # half up, as ROUND() in the database
+    return (price - price * discount / 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def sell_price_expression(price=None, discount=None):
+    # the same in SQL; 0.01 instead of / 100 keeps SQLite away from integer division
+    price = F("price") if price is None else price
+    discount = F("discount") if discount is None else discount
+    if not hasattr(price, "resolve_expression"):
+        price = Value(Decimal(str(price)))
+    if not hasattr(discount, "resolve_expression"):
+        discount = Value(Decimal(str(discount)))
+
+    money = DecimalField(max_digits=7, decimal_places=2)
+    return Round(price - price * discount * Value(Decimal("0.01")), 2, output_field=money)
+
+
+class CatalogQueryset(models.QuerySet):
+
+    def update(self, **kwargs):
+        if self.model is Products and SELL_PRICE_FIELDS & set(kwargs):
+            kwargs["sell_price"] = sell_price_expression(kwargs.get("price"), kwargs.get("discount"))
+        catalog_change = bool(set(kwargs) - STOCK_FIELDS)
+        # auto_now is not applied by update(); stock moves don't change the page
+        if catalog_change and "updated_at" not in kwargs:
+            kwargs["updated_at"] = Now()
+        # cached product pages of the rows go too
+        slugs = ()
+        if self.model is Products and catalog_change:
+            slugs = list(self.values_list("slug", flat=True))
+        rows = super().update(**kwargs)
+        if rows and catalog_change:
+            bump_catalog_version()
+            bump_product_versions(slugs)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self.model is Products:
+            for obj in objs:
+                obj.sell_price = obj.calculate_sell_price()
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            bump_catalog_version()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if self.model is Products and SELL_PRICE_FIELDS & set(fields):
+            for obj in objs:
+                obj.sell_price = obj.calculate_sell_price()
+            fields = [*fields, "sell_price"]
+        if set(fields) - STOCK_FIELDS and "updated_at" not in fields:
+            now = timezone.now()
+            for obj in objs:
+                obj.updated_at = now
+            fields = [*fields, "updated_at"]
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows and set(fields) - STOCK_FIELDS:
+            bump_catalog_version()
+            if self.model is Products:
+                bump_product_versions(obj.slug for obj in objs)
+        return rows
+
+
+class CategoriesQueryset(CatalogQueryset):
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            bump_categories_version()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            bump_categories_version()
+        return objs
 
 
 class Categories(models.Model):
     name = models.CharField(max_length=150, unique=True, verbose_name='Название')
     slug = models.SlugField(max_length=200, unique=True, blank=True, null=True, verbose_name='URL')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
 
     class Meta:
         db_table = 'category'
@@ -12,6 +108,8 @@ class Categories(models.Model):
         verbose_name_plural = 'Категории'
         ordering = ("id",)
 
+    objects = CategoriesQueryset.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -21,10 +119,23 @@ class Products(models.Model):
     slug = models.SlugField(max_length=200, unique=True, blank=True, null=True, verbose_name='URL')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     image = models.ImageField(upload_to='goods_images', blank=True, null=True, verbose_name='Изображение')
+    # sha1 of the image, names the directory of its thumbnails (goods.thumbnails)
+    image_hash = models.CharField(max_length=40, blank=True, default='', editable=False, verbose_name='Хеш изображения')
     price = models.DecimalField(default=0.00, max_digits=7, decimal_places=2, verbose_name='Цена')
     discount = models.DecimalField(default=0.00, max_digits=4, decimal_places=2, verbose_name='Скидка в %')
+    # price with the discount, kept by the pre_save signal and CatalogQueryset
+    sell_price = models.DecimalField(
+        default=0.00, max_digits=7, decimal_places=2, editable=False, db_index=True,
+        verbose_name='Цена со скидкой',
+    )
     quantity = models.PositiveIntegerField(default=0, verbose_name='Количество')
+    # held by carts (carts.Reservation), quantity - reserved can still be sold
+    reserved = models.PositiveIntegerField(default=0, editable=False, verbose_name='Зарезервировано')
     category = models.ForeignKey(to=Categories, on_delete=models.CASCADE, verbose_name='Категория')
+    # weighted name (A) + description (B), filled by a DB trigger on Postgres
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Last-Modified of the product page; stock changes don't move it
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
 
 
     class Meta:
@@ -32,10 +143,58 @@ class Products(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ("id",)
+        indexes = [
+            # a category sorted by price
+            models.Index(fields=["category", "sell_price"], name="product_category_price_idx"),
+            # on_sale: only the discounted rows, in price order
+            models.Index(
+                fields=["sell_price"], condition=Q(discount__gt=0), name="product_on_sale_price_idx",
+            ),
+        ]
+
+    objects = CatalogQueryset.as_manager()
 
     def __str__(self):
         return f'{self.name} Количество - {self.quantity}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a renamed product has to purge the cached page of its old slug too
+        instance._loaded_slug = instance.__dict__.get("slug")
+        # the image hash is only recomputed when the image changes
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        if fields is None or "image" in fields:
+            self._loaded_image = self.image.name
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            # derived fields go with the fields they follow
+            update_fields = set(update_fields)
+            if SELL_PRICE_FIELDS & update_fields:
+                update_fields.add("sell_price")
+            if "image" in update_fields:
+                update_fields.add("image_hash")
+            if update_fields - STOCK_FIELDS:
+                update_fields.add("updated_at")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # reserved is only moved by conditional UPDATEs (carts.Reservation),
+        # the UPDATE of a full save must not write a stale value back. Only
+        # the column is left out: the save stays a full one (update_fields
+        # is None for the signals, a missing row is inserted), and an
+        # explicit update_fields=["reserved"] still writes it.
+        if update_fields is None:
+            values = [value for value in values if value[0].name != "reserved"]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
     def get_absolute_url(self):
         return reverse("catalog:product", kwargs={"product_slug": self.slug})
     
@@ -44,8 +203,43 @@ class Products(models.Model):
         return f"{self.id:05}"
 
 
-    def sell_price(self):
-        if self.discount:
-            return round(self.price - self.price*self.discount/100, 2)
-        
-        return self.price
\ No newline at end of file
+    def available(self):
+        return max(self.quantity - self.reserved, 0)
+
+
+    def calculate_sell_price(self):
+        return calculate_sell_price(self.price, self.discount)
+
+
+class FTSMatch(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class FTSDocumentField(models.TextField):
+    pass
+
+
+FTSDocumentField.register_lookup(FTSMatch)
+
+
+class ProductsFTS(models.Model):
+    # SQLite FTS5 index of Products, created by goods.search.SQLiteFTSSearchBackend
+    product = models.OneToOneField(
+        to=Products, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column="rowid", related_name="fts",
+    )
+    name = models.TextField()
+    description = models.TextField()
+    # hidden column named after the table, `product_fts MATCH ...` searches all columns
+    document = FTSDocumentField(db_column="product_fts")
+    # hidden column with the configured bm25() score
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "product_fts"
@@ -0,0 +1,131 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+# Seek pagination over `ordering` (the last field must be unique, e.g. id).
+# Pages are addressed by opaque cursors instead of numbers, so neither
+# COUNT(*) nor OFFSET is ever executed.
+class KeysetPaginator:
+    NEXT = "n"
+    PREVIOUS = "p"
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    @staticmethod
+    def _split(field):
+        return (field[1:], True) if field.startswith("-") else (field, False)
+
+    @staticmethod
+    def _reverse(ordering):
+        return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+
+    def _seek(self, ordering, values):
+        # (a > x) OR (a = x AND b > y) ... for every column of the ordering
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name, descending = self._split(field)
+            lookup = "lt" if descending else "gt"
+            step = Q(**{f"{name}__{lookup}": values[index]})
+            for prev_field, prev_value in zip(ordering[:index], values[:index]):
+                step &= Q(**{self._split(prev_field)[0]: prev_value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, obj, direction):
+        opts = self.queryset.model._meta
+        values = [
+            opts.get_field(self._split(field)[0]).value_to_string(obj)
+            for field in self.ordering
+        ]
+        raw = json.dumps({"d": direction, "v": values}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            data = json.loads(raw)
+            direction, values = data["d"], data["v"]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor("Некорректный курсор")
+
+        if direction not in (self.NEXT, self.PREVIOUS) or len(values) != len(self.ordering):
+            raise InvalidCursor("Некорректный курсор")
+
+        opts = self.queryset.model._meta
+        try:
+            values = [
+                opts.get_field(self._split(field)[0]).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor("Некорректный курсор")
+        return direction, values
+
+    def page(self, cursor=None):
+        direction, values = self.NEXT, None
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+
+        ordering = self.ordering if direction == self.NEXT else self._reverse(self.ordering)
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(ordering, values))
+
+        # one extra row tells whether there is anything beyond this page
+        rows = list(queryset.order_by(*ordering)[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if direction == self.NEXT:
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1], self.NEXT)
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], self.PREVIOUS)
+
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
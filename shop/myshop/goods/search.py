@@ -0,0 +1,225 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchVector,
+    SearchQuery,
+    SearchRank,
+    SearchHeadline,
+)
+from django.db import connections, transaction
+from django.db.models import F, Func, Q, TextField, Value
+from django.utils.module_loading import import_string
+
+from goods.models import Products
+
+
+HIGHLIGHT_START = '<span style="background-color: yellow;">'
+HIGHLIGHT_STOP = "</span>"
+
+
+class BaseSearchBackend:
+    # Filters `queryset` by `query`, annotates `rank` and orders by it.
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    # Annotates `headline` (name) and `bodyline` (description) with the
+    # matched words wrapped into HIGHLIGHT_START/HIGHLIGHT_STOP.
+    def highlight(self, queryset, query):
+        return queryset
+
+    # Creates whatever the backend needs in the database, must be idempotent.
+    def install(self, connection):
+        pass
+
+    # Recomputes the search index for all products.
+    def rebuild(self, connection, batch_size=1000):
+        return 0
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def search(self, queryset, query):
+        query = SearchQuery(query)
+
+        # rank against the stored, GIN indexed document instead of building
+        # a tsvector for every row on every search
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank")
+        )
+
+    def highlight(self, queryset, query):
+        query = SearchQuery(query)
+        return queryset.annotate(
+            headline=SearchHeadline(
+                "name", query, start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP
+            ),
+            bodyline=SearchHeadline(
+                "description", query, start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP
+            ),
+        )
+
+    def rebuild(self, connection, batch_size=1000):
+        vector = SearchVector("name", weight="A") + SearchVector("description", weight="B")
+        last_id, total = 0, 0
+
+        while True:
+            ids = list(
+                Products.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+
+            with transaction.atomic():
+                total += Products.objects.filter(id__in=ids).update(search_vector=vector)
+            last_id = ids[-1]
+
+
+class FTSHighlight(Func):
+    function = "highlight"
+    output_field = TextField()
+
+    def __init__(self, column):
+        super().__init__(
+            F("fts__document"), Value(column), Value(HIGHLIGHT_START), Value(HIGHLIGHT_STOP)
+        )
+
+
+class FTSSnippet(Func):
+    function = "snippet"
+    output_field = TextField()
+
+    def __init__(self, column, tokens=35):
+        super().__init__(
+            F("fts__document"),
+            Value(column),
+            Value(HIGHLIGHT_START),
+            Value(HIGHLIGHT_STOP),
+            Value("..."),
+            Value(tokens),
+        )
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    # external content FTS5 index over product(name, description), kept in
+    # sync by triggers; rowid of the index is product.id
+    table = "product_fts"
+    rank_function = "bm25(10.0, 1.0)"
+
+    install_sql = [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+            name, description,
+            content='product', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        f"INSERT INTO {table}({table}, rank) VALUES('rank', '{rank_function}')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON product BEGIN
+            INSERT INTO {table}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON product BEGIN
+            INSERT INTO {table}({table}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF name, description ON product BEGIN
+            INSERT INTO {table}({table}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {table}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """,
+    ]
+
+    uninstall_sql = [
+        f"DROP TRIGGER IF EXISTS {table}_ai",
+        f"DROP TRIGGER IF EXISTS {table}_ad",
+        f"DROP TRIGGER IF EXISTS {table}_au",
+        f"DROP TABLE IF EXISTS {table}",
+    ]
+
+    @staticmethod
+    def match_expression(query):
+        # every word is quoted, so user input can't break the FTS5 syntax;
+        # the prefix match stands in for stemming
+        words = re.findall(r"\w+", query)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+
+        return (
+            queryset.filter(fts__document__match=match)
+            # bm25 is negative, the better the match the lower it is
+            .annotate(rank=-F("fts__rank"))
+            .order_by("-rank")
+        )
+
+    def highlight(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+
+        return queryset.filter(fts__document__match=match).annotate(
+            headline=FTSHighlight(0),
+            bodyline=FTSSnippet(1),
+        )
+
+    def install(self, connection):
+        # Django remakes SQLite tables on some schema changes, which drops
+        # the triggers, so this runs again after every migrate
+        if "product" not in connection.introspection.table_names():
+            return
+        with connection.cursor() as cursor:
+            for sql in self.install_sql:
+                cursor.execute(sql)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for sql in self.uninstall_sql:
+                cursor.execute(sql)
+
+    def rebuild(self, connection, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES('rebuild')")
+        return Products.objects.using(connection.alias).count()
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    def search(self, queryset, query):
+        keywords = [word for word in query.split() if len(word) > 2]
+        if not keywords:
+            return queryset.none()
+
+        q_objects = Q()
+        for token in keywords:
+            q_objects |= Q(description__icontains=token)
+            q_objects |= Q(name__icontains=token)
+
+        return queryset.filter(q_objects)
+
+
+VENDOR_BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteFTSSearchBackend,
+}
+
+
+def get_search_backend(using="default"):
+    path = getattr(settings, "GOODS_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+
+    vendor = connections[using].vendor
+    return VENDOR_BACKENDS.get(vendor, SimpleSearchBackend)()
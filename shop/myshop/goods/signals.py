@@ -0,0 +1,76 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from goods.cache import bump_catalog_version, bump_categories_version, bump_product_versions
+from goods.models import STOCK_FIELDS, Categories, Products
+from jobs.queue import enqueue
+
+
+def update_sell_price(sender, instance, **kwargs):
+    # also runs for raw saves (loaddata), which skip Products.save()
+    instance.sell_price = instance.calculate_sell_price()
+
+
+def update_image_hash(sender, instance, raw, **kwargs):
+    # a new upload or another file of the storage: the old hash (and with it
+    # the thumbnails) goes until the worker has made the new ones
+    if raw:
+        return
+    image = instance.image
+    instance._image_changed = bool(image) and (
+        not image._committed or image.name != getattr(instance, "_loaded_image", None)
+    )
+    if not image or instance._image_changed:
+        instance.image_hash = ""
+
+
+def create_thumbnails(sender, instance, raw, **kwargs):
+    # decoding and resizing happen in the worker, not in the request
+    if raw or not getattr(instance, "_image_changed", False):
+        return
+    instance._image_changed = False
+    instance._loaded_image = instance.image.name
+    enqueue("goods.make_thumbnails", instance.pk, instance.image.name)
+
+
+def fill_updated_at(sender, instance, raw, **kwargs):
+    # raw saves skip auto_now, and fixtures come without the timestamps
+    if raw and instance.updated_at is None:
+        instance.updated_at = timezone.now()
+
+
+def is_stock_only(update_fields):
+    # save(update_fields=["quantity"]) etc.: nothing the pages show changed,
+    # as with CatalogQueryset.update()
+    return bool(update_fields) and not set(update_fields) - STOCK_FIELDS
+
+
+def invalidate_catalog(sender, instance, update_fields=None, **kwargs):
+    if is_stock_only(update_fields):
+        return
+    bump_catalog_version()
+
+
+def invalidate_product_page(sender, instance, update_fields=None, **kwargs):
+    if is_stock_only(update_fields):
+        return
+    bump_product_versions([instance.slug, getattr(instance, "_loaded_slug", None)])
+
+
+def invalidate_categories(sender, instance, **kwargs):
+    bump_categories_version()
+
+
+pre_save.connect(update_sell_price, sender=Products)
+pre_save.connect(fill_updated_at, sender=Products)
+pre_save.connect(update_image_hash, sender=Products)
+post_save.connect(create_thumbnails, sender=Products)
+pre_save.connect(fill_updated_at, sender=Categories)
+post_save.connect(invalidate_catalog, sender=Products)
+post_delete.connect(invalidate_catalog, sender=Products)
+post_save.connect(invalidate_product_page, sender=Products)
+post_delete.connect(invalidate_product_page, sender=Products)
+post_save.connect(invalidate_catalog, sender=Categories)
+post_delete.connect(invalidate_catalog, sender=Categories)
+post_save.connect(invalidate_categories, sender=Categories)
+post_delete.connect(invalidate_categories, sender=Categories)
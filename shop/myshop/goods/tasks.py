@@ -0,0 +1,26 @@
+import logging
+
+from goods.models import Products
+from goods.thumbnails import file_hash, make_thumbnails
+from jobs.queue import task
+
+
+logger = logging.getLogger("myshop.jobs")
+
+
+@task("goods.make_thumbnails")
+def make_product_thumbnails(product_id, image_name):
+    # the hash is published only with the variants in place, until then the
+    # pages show the original image
+    product = Products.objects.filter(pk=product_id, image=image_name).only("id", "image").first()
+    if product is None:
+        # the image was replaced again, its own job does that one
+        return
+    try:
+        digest = file_hash(product.image)
+    except FileNotFoundError:
+        logger.warning("Нет файла изображения товара #%s: %s", product_id, image_name)
+        return
+    make_thumbnails(product.image, digest)
+    # update() moves updated_at and the cached pages: the <picture> appears
+    Products.objects.filter(pk=product_id, image=image_name).update(image_hash=digest)
@@ -1,8 +1,12 @@
 from django import template
+from django.core.cache import cache
+from django.templatetags.static import static
+from django.utils.html import format_html
 from django.utils.http import urlencode
 
-
-from goods.models import Categories
+from goods.cache import get_categories
+from goods.thumbnails import thumbnail_urls, thumbnails_ready
+from jobs.queue import enqueue
 
 
 register = template.Library()
@@ -10,7 +14,7 @@ register = template.Library()
 
 @register.simple_tag()
 def tag_categories():
-    return Categories.objects.all()
+    return get_categories()
 
 
 @register.simple_tag(takes_context=True)
@@ -21,5 +25,37 @@ def change_params(context, **kwargs):
     # print(context['slug_url'])
     # print(context['goods'])
     # print([product.name for product in context['goods']])
+    # a cached page is the same for any other parameters, so are its links
+    known = getattr(context.get('view'), 'page_cache_params', ())
+    if known:
+        query = {key: value for key, value in query.items() if key in known}
     query.update(kwargs)
-    return urlencode(query)
\ No newline at end of file
+    # None drops the parameter, e.g. page=None when switching to a cursor
+    query = {key: value for key, value in query.items() if value is not None}
+    return urlencode(query)
+
+
+@register.simple_tag()
+def product_image(product, sizes="100vw", css_class=""):
+    # <picture> with WebP and JPEG thumbnails, the browser picks the width from srcset
+    if not product.image:
+        src = static("deps/images/Not found image.png")
+        return format_html('<img src="{}" class="{}" alt="{}">', src, css_class, product.name)
+    original = format_html('<img src="{}" class="{}" alt="{}">', product.image.url, css_class, product.name)
+    if not product.image_hash:
+        # not processed yet (a new upload, loaddata), see manage.py make_thumbnails
+        return original
+    if not thumbnails_ready(product.image_hash):
+        # new THUMBNAIL_WIDTHS or cleaned media: made again by the worker,
+        # one job per image for a while however many pages show it
+        if cache.add(f"thumbnails:{product.image_hash}:queued", True, 600):
+            enqueue("goods.make_thumbnails", product.pk, product.image.name)
+        return original
+
+    urls = thumbnail_urls(product.image_hash)
+    webp, jpeg = (", ".join(f"{url} {width}w" for width, url in urls[ext]) for ext in ("webp", "jpg"))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        webp, sizes, urls["jpg"][0][1], jpeg, sizes, css_class, product.name,
+    )
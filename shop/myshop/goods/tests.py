@@ -1,3 +1,476 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import Paginator
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from common.cache import cache_stats
+from common.testing import QueryBudgetMixin, TempMediaMixin
+from goods.cache import (
+    RESULTS_METRICS,
+    CachedProductList,
+    get_cached_results,
+    get_catalog_version,
+    get_product_version,
+)
+from goods.models import Categories, Products
+from goods.paginators import InvalidCursor, KeysetPaginator
+from goods.search import HIGHLIGHT_START, HIGHLIGHT_STOP
+from goods.tasks import make_product_thumbnails
+from goods.thumbnails import ready_marker_name, thumbnail_name
+from goods.utils import q_highlight, q_search
+from goods.views import CatalogView
+from jobs.models import Job
+from users.models import User
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def check_pages(self):
+        self.assertWithinBudget("catalog:index", ["all"])
+        self.assertWithinBudget("catalog:index", ["all"], {"order_by": "price", "on_sale": "on"})
+        self.assertWithinBudget("catalog:search", data={"q": "стол"})
+        self.assertWithinBudget("catalog:product", [Products.objects.first().slug])
+
+    def test_anonymous(self):
+        self.check_pages()
+
+    def test_user(self):
+        # no page cache for users, the cart button renders their cart
+        self.client.force_login(User.objects.create_user("user", password="password"))
+        self.check_pages()
+
+
+class PageCacheTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        cache.clear()
+        self.catalog_url = reverse("catalog:index", args=["all"])
+        self.product = Products.objects.get(pk=1)
+        self.product_url = reverse("catalog:product", args=[self.product.slug])
+
+    def test_cached_hit(self):
+        first = self.client.get(self.catalog_url, {"page": 2})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.catalog_url, {"page": 2})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        # unknown parameters get the same page from the same cache entry
+        with self.assertNumQueries(0):
+            junk = self.client.get(self.catalog_url, {"page": 2, "utm_source": "mail", "_": "123"})
+        self.assertEqual(junk.content, first.content)
+        self.assertNotContains(junk, "utm_source")
+        # a known one is another page
+        self.assertNotEqual(self.client.get(self.catalog_url, {"page": 3})["ETag"], first["ETag"])
+
+    def test_cart_placeholder(self):
+        response = self.client.get(self.catalog_url)
+        self.assertContains(response, 'id="cart-fragment"')
+        self.assertContains(response, reverse("cart:cart_fragment"))
+        self.assertNotContains(response, 'id="goods-in-cart-count"')
+
+        # a user gets the cart itself, and no cached page
+        self.client.force_login(User.objects.create_user("user", password="password"))
+        response = self.client.get(self.catalog_url)
+        self.assertNotContains(response, 'id="cart-fragment"')
+        self.assertContains(response, 'id="goods-in-cart-count"')
+
+    def test_catalog_version_bump(self):
+        self.client.get(self.catalog_url)
+        self.product.name = "Новый столик"
+        self.product.save()
+        response = self.client.get(self.catalog_url)
+        self.assertContains(response, "Новый столик")
+
+    def test_product_version_bump(self):
+        other = Products.objects.get(pk=2)
+        other_url = reverse("catalog:product", args=[other.slug])
+        self.client.get(self.product_url)
+        self.client.get(other_url)
+
+        self.product.description = "Новое описание"
+        self.product.save()
+        response = self.client.get(self.product_url)
+        self.assertContains(response, "Новое описание")
+        # the page of another product stays in the cache
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+
+class ConditionalGetTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        cache.clear()
+        # loaddata stamps the rows with now, an edit in the same second would
+        # keep Last-Modified (HTTP dates have no fractions)
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Categories.objects.update(updated_at=an_hour_ago)
+        Products.objects.update(updated_at=an_hour_ago)
+        self.product = Products.objects.get(pk=1)
+        self.url = reverse("catalog:product", args=[self.product.slug])
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get(self.url, headers={"If-None-Match": '"other"'}).status_code, 200)
+
+        catalog_url = reverse("catalog:index", args=["all"])
+        etag = self.client.get(catalog_url)["ETag"]
+        self.assertEqual(self.client.get(catalog_url, headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["Last-Modified"], last_modified)
+
+    def test_product_edit(self):
+        first = self.client.get(self.url)
+        self.product.price = 200
+        self.product.save()
+
+        response = self.client.get(self.url, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        response = self.client.get(self.url, headers={"If-Modified-Since": first["Last-Modified"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+
+
+class ProductImageTagTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        buffer = BytesIO()
+        Image.new("RGB", (1200, 900), "teal").save(buffer, "JPEG")
+        category = Categories.objects.create(name="Кухня", slug="kuhnya")
+        self.product = Products.objects.create(
+            name="Стол", slug="stol", category=category,
+            image=SimpleUploadedFile("stol.jpg", buffer.getvalue(), content_type="image/jpeg"),
+        )
+        Job.objects.all().delete()
+
+    def render(self):
+        template = Template('{% load goods_tags %}{% product_image product sizes="50vw" css_class="card-img-top" %}')
+        return template.render(Context({"product": self.product}))
+
+    def test_picture(self):
+        make_product_thumbnails(self.product.pk, self.product.image.name)
+        self.product.refresh_from_db()
+        digest = self.product.image_hash
+        cache.clear()
+
+        with mock.patch.object(default_storage, "exists", wraps=default_storage.exists) as exists:
+            html = self.render()
+        # the marker file only, not every variant
+        exists.assert_called_once_with(ready_marker_name(digest))
+
+        def srcset(extension):
+            return ", ".join(
+                f"{settings.MEDIA_URL}{thumbnail_name(digest, width, extension)} {width}w" for width in (320, 640, 960)
+            )
+
+        self.assertHTMLEqual(html, (
+            f'<picture><source type="image/webp" srcset="{srcset("webp")}" sizes="50vw">'
+            f'<img src="{settings.MEDIA_URL}{thumbnail_name(digest, 320, "jpg")}" srcset="{srcset("jpg")}" '
+            f'sizes="50vw" class="card-img-top" alt="Стол" loading="lazy"></picture>'
+        ))
+        # ready is cached
+        with mock.patch.object(default_storage, "exists") as exists:
+            self.render()
+        exists.assert_not_called()
+
+    def test_no_hash(self):
+        # not processed yet: the original, nothing queued by the page
+        self.assertHTMLEqual(
+            self.render(), f'<img src="{self.product.image.url}" class="card-img-top" alt="Стол">'
+        )
+        self.assertFalse(Job.objects.exists())
+
+        self.product.image = None
+        self.assertIn("Not%20found%20image.png", self.render())
+
+    def test_missing_thumbnails_queued_once(self):
+        # a hash, but the variants are gone (new THUMBNAIL_WIDTHS, cleaned media)
+        Products.objects.filter(pk=self.product.pk).update(image_hash="ab" * 20)
+        self.product.refresh_from_db()
+        for _ in range(3):
+            html = self.render()
+        self.assertHTMLEqual(html, f'<img src="{self.product.image.url}" class="card-img-top" alt="Стол">')
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args), ("goods.make_thumbnails", [self.product.pk, self.product.image.name]))
+
+
+class SellPriceTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def sell_price(self, pk=1):
+        return Products.objects.values_list("sell_price", flat=True).get(pk=pk)
+
+    def test_loaddata(self):
+        # 150.00 - 10%
+        self.assertEqual(self.sell_price(), Decimal("135.00"))
+
+    def test_save(self):
+        product = Products.objects.get(pk=1)
+        product.price = Decimal("200.00")
+        product.save()
+        self.assertEqual(self.sell_price(), Decimal("180.00"))
+
+        product.discount = Decimal("50.00")
+        product.save(update_fields=["discount"])
+        self.assertEqual(self.sell_price(), Decimal("100.00"))
+
+    def test_update(self):
+        Products.objects.filter(pk=1).update(price=Decimal("10.01"))
+        self.assertEqual(self.sell_price(), Decimal("9.01"))
+        Products.objects.filter(pk=1).update(discount=Decimal("50.00"))
+        # half up, as calculate_sell_price in Python
+        self.assertEqual(self.sell_price(), Decimal("5.01"))
+        self.assertEqual(self.sell_price(), Products.objects.get(pk=1).calculate_sell_price())
+
+        # other fields leave it alone
+        Products.objects.filter(pk=1).update(quantity=3)
+        self.assertEqual(self.sell_price(), Decimal("5.01"))
+
+    def test_bulk_update(self):
+        products = list(Products.objects.filter(pk__in=[1, 2]))
+        for product in products:
+            product.price = Decimal("99.99")
+            product.discount = Decimal("12.50")
+        Products.objects.bulk_update(products, ["price", "discount"])
+        self.assertEqual(
+            dict(Products.objects.filter(pk__in=[1, 2]).values_list("id", "sell_price")),
+            {1: Decimal("87.49"), 2: Decimal("87.49")},
+        )
+
+    def test_admin_list_editable(self):
+        self.client.force_login(User.objects.create_superuser("admin", password="password"))
+        response = self.client.post(reverse("admin:goods_products_changelist"), {
+            "form-TOTAL_FORMS": "1",
+            "form-INITIAL_FORMS": "1",
+            "form-0-id": "1",
+            "form-0-discount": "20.00",
+            "_save": "Сохранить",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.sell_price(), Decimal("120.00"))
+
+
+class KeysetPaginatorTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def walk(self, ordering, per_page=5):
+        paginator = KeysetPaginator(Products.objects.all(), per_page, ordering)
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append([product.id for product in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        # and back from the last page by the previous cursors
+        back = [pages[-1]]
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            back.append([product.id for product in page])
+        self.assertEqual(back[::-1], pages)
+        return pages
+
+    def offset_pages(self, ordering, per_page=5):
+        paginator = Paginator(Products.objects.order_by(*ordering), per_page)
+        return [[product.id for product in paginator.page(number)] for number in paginator.page_range]
+
+    def test_matches_offset(self):
+        for ordering in CatalogView.keyset_orderings.values():
+            with self.subTest(ordering=ordering):
+                self.assertEqual(self.walk(ordering), self.offset_pages(ordering))
+
+    def test_ties_broken_by_id(self):
+        # the same price everywhere, only id orders the rows
+        Products.objects.filter(pk__in=[2, 5, 7, 9, 10, 12]).update(price=100, discount=0)
+        for ordering in (("sell_price", "id"), ("-sell_price", "-id")):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(ordering, per_page=2)
+                self.assertEqual(pages, self.offset_pages(ordering, per_page=2))
+                ids = sum(pages, [])
+                self.assertEqual(sorted(ids), list(range(1, 13)))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Products.objects.all(), 5, ("sell_price", "id"))
+
+        def cursor(data):
+            return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+        for bad in (
+            "junk",
+            cursor([]),
+            cursor({"d": "x", "v": ["10.00", "1"]}),
+            cursor({"d": "n", "v": ["10.00"]}),
+            cursor({"d": "n", "v": ["десять", "1"]}),
+        ):
+            with self.subTest(cursor=bad):
+                with self.assertRaises(InvalidCursor):
+                    paginator.page(bad)
+
+    @override_settings(CATALOG_KEYSET_PAGINATION=True)
+    def test_view(self):
+        cache.clear()
+        url = reverse("catalog:index", args=["all"])
+        ids, data = [], {"order_by": "-price"}
+        while True:
+            response = self.client.get(url, data)
+            ids += [product.id for product in response.context["goods"]]
+            page = response.context["page_obj"]
+            if not page.has_next():
+                break
+            data["cursor"] = page.next_cursor
+        self.assertEqual(ids, list(Products.objects.order_by("-sell_price", "-id").values_list("id", flat=True)))
+
+        response = self.client.get(url, {"order_by": "-price", "cursor": "junk"})
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 index of SQLite")
+class FTSSearchTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def ids(self, query):
+        return [product.id for product in q_search(query)]
+
+    def test_rank(self):
+        # a match in the name weighs more than one in the description;
+        # "кровать" is a prefix of "кроватью"
+        ids = self.ids("кровать")
+        self.assertEqual(ids[0], 3)
+        self.assertEqual(sorted(ids), [3, 6, 12])
+        ranks = [product.rank for product in q_search("кровать")]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+        self.assertEqual(sorted(self.ids("угловой диван")), [6])
+        # no FTS5 syntax from the user: quotes are dropped, OR is a word to match
+        self.assertEqual(sorted(self.ids('"диван')), [6, 8])
+        self.assertEqual(self.ids("диван OR стул"), [])
+        self.assertEqual(self.ids("?!"), [])
+        self.assertEqual(self.ids("7"), [7])
+
+    def test_index_follows_edits(self):
+        product = Products.objects.get(pk=10)
+        product.name = "Фикус"
+        product.description = "Фикус в горшке."
+        product.save()
+        self.assertEqual(self.ids("фикус"), [10])
+        self.assertEqual(self.ids("растение"), [])
+
+        Products.objects.filter(pk=10).update(name="Монстера")
+        self.assertEqual(self.ids("монстера"), [10])
+        self.assertEqual(self.ids("горшке"), [10])
+
+        product.delete()
+        self.assertEqual(self.ids("монстера"), [])
+
+        Products.objects.create(name="Кресло", slug="kreslo", description="Кресло-качалка.", category=Categories.objects.first())
+        self.assertEqual(len(self.ids("качалка")), 1)
+
+    def test_highlight(self):
+        products = q_highlight(q_search("диван"), "диван")
+        by_id = {product.id: product for product in products}
+        self.assertEqual(set(by_id), {6, 8})
+        self.assertEqual(by_id[6].headline, f"Угловой {HIGHLIGHT_START}диван{HIGHLIGHT_STOP} для гостинной")
+        self.assertIn(f"{HIGHLIGHT_START}Диван{HIGHLIGHT_STOP}, он же софа", by_id[8].bodyline)
+
+        # a product id searched for is shown as it is
+        product = q_highlight(q_search("8"), "8")[0]
+        self.assertFalse(hasattr(product, "headline"))
+
+    def test_view(self):
+        cache.clear()
+        response = self.client.get(reverse("catalog:search"), {"q": "диван"})
+        self.assertEqual({product.id for product in response.context["goods"]}, {6, 8})
+        self.assertContains(response, f"{HIGHLIGHT_START}диван{HIGHLIGHT_STOP}")
+
+
+class ResultsCacheTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        cache.clear()
+
+    def results(self, query=None, category_slug="all", on_sale=None, order_by=None):
+        queryset = Products.objects.all()
+        if order_by and order_by != "default":
+            queryset = queryset.order_by({"price": "sell_price", "-price": "-sell_price"}.get(order_by, order_by))
+        return get_cached_results(queryset, query, category_slug, on_sale, order_by)
+
+    def test_ids_cached(self):
+        with self.assertNumQueries(1):
+            results = self.results(order_by="-price")
+        self.assertIsInstance(results, CachedProductList)
+        expected = list(Products.objects.order_by("-sell_price").values_list("id", flat=True))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(results), 12)
+            self.assertTrue(results.exists())
+
+        # a page by primary key, in the cached order
+        with self.assertNumQueries(1):
+            self.assertEqual([product.id for product in results[3:6]], expected[3:6])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.results(order_by="-price").ids, expected)
+        self.assertEqual(cache_stats(RESULTS_METRICS), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    def test_key(self):
+        self.results(query="Угловой  Диван")
+        # the same words the same key, other filters another one
+        with self.assertNumQueries(0):
+            self.results(query=" угловой диван ")
+        with self.assertNumQueries(1):
+            self.results(query="угловой диван", on_sale="on")
+
+    def test_not_cached(self):
+        # an ordering nobody links to, and too long result sets
+        self.assertNotIsInstance(self.results(order_by="name"), CachedProductList)
+        with override_settings(CATALOG_RESULTS_CACHE_MAX_IDS=5):
+            self.assertNotIsInstance(self.results(), CachedProductList)
+
+    def test_invalidation(self):
+        self.results()
+        product = Products.objects.get(pk=1)
+        version, product_version = get_catalog_version(), get_product_version(product.slug)
+
+        # stock moves don't drop the cached results, nor the product page
+        product.quantity = 5
+        product.save(update_fields=["quantity"])
+        Products.objects.filter(pk=1).update(reserved=1)
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(get_product_version(product.slug), product_version)
+        with self.assertNumQueries(0):
+            self.results()
+
+        product.save(update_fields=["quantity", "name"])
+        self.assertNotEqual(get_catalog_version(), version)
+        version = get_catalog_version()
+        product.delete()
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(len(self.results()), 11)
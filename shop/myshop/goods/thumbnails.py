@@ -0,0 +1,93 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from common.images import encode_image, open_image
+
+
+# (Pillow format, extension); the first one is the <source> of <picture>,
+# the last one is the <img> fallback
+THUMBNAIL_FORMATS = (("WEBP", "webp"), ("JPEG", "jpg"))
+
+
+def thumbnail_widths():
+    return tuple(getattr(settings, "THUMBNAIL_WIDTHS", (320, 640, 960)))
+
+
+def file_hash(fieldfile):
+    # the variants are addressed by the content, not by the upload name
+    digest = hashlib.sha1()
+    for chunk in fieldfile.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumbnail_name(digest, width, extension):
+    return f"{getattr(settings, 'THUMBNAILS_DIR', 'thumbnails')}/{digest[:2]}/{digest}/{width}.{extension}"
+
+
+def _widths_tag():
+    return "-".join(map(str, thumbnail_widths()))
+
+
+def _ready_key(digest):
+    return f"thumbnails:{digest}:{_widths_tag()}"
+
+
+def ready_marker_name(digest):
+    # written after the last variant of the current widths, so a single
+    # exists() instead of one per variant tells that they are all there
+    return thumbnail_name(digest, "ready", _widths_tag())
+
+
+def thumbnails_ready(digest):
+    if cache.get(_ready_key(digest)):
+        return True
+    if not default_storage.exists(ready_marker_name(digest)):
+        return False
+    cache.set(_ready_key(digest), True, None)
+    return True
+
+
+def missing_thumbnails(digest):
+    return [
+        (width, image_format, extension)
+        for width in thumbnail_widths()
+        for image_format, extension in THUMBNAIL_FORMATS
+        if not default_storage.exists(thumbnail_name(digest, width, extension))
+    ]
+
+
+def make_thumbnails(fieldfile, digest):
+    # every width in every format; an image narrower than a width is not
+    # upscaled, its variant is just the image re-encoded
+    if thumbnails_ready(digest):
+        return
+
+    missing = missing_thumbnails(digest)
+    if missing:
+        image = open_image(fieldfile)
+        quality = getattr(settings, "THUMBNAIL_QUALITY", 80)
+        for width, image_format, extension in missing:
+            variant = image.copy()
+            variant.thumbnail((width, width * 10), Image.LANCZOS)
+            data = encode_image(variant, image_format, quality)
+            default_storage.save(thumbnail_name(digest, width, extension), ContentFile(data))
+
+    default_storage.save(ready_marker_name(digest), ContentFile(b""))
+    cache.set(_ready_key(digest), True, None)
+
+
+def thumbnail_urls(digest):
+    # {extension: [(width, url), ...]}
+    return {
+        extension: [
+            (width, default_storage.url(thumbnail_name(digest, width, extension)))
+            for width in thumbnail_widths()
+        ]
+        for image_format, extension in THUMBNAIL_FORMATS
+    }
@@ -1,50 +1,39 @@
-from django.db.models import Q
-from django.contrib.postgres.search import (
-    SearchVector,
-    SearchQuery,
-    SearchRank,
-    SearchHeadline,
-)
-
 from goods.models import Products
+from goods.search import get_search_backend
+
+
+def is_id_query(query):
+    return query.isdigit() and len(query) <= 5
 
 
 def q_search(query):
-    if query.isdigit() and len(query) <= 5:
+    if is_id_query(query):
         return Products.objects.filter(id=int(query))
 
-    vector = SearchVector("name", "description")
-    query = SearchQuery(query)
+    # only the rank/ID phase, highlighting is done by q_highlight for
+    # the products that actually get rendered
+    return get_search_backend().search(Products.objects.all(), query)
 
-    result = (
-        Products.objects.annotate(rank=SearchRank(vector, query))
-        .filter(rank__gt=0)
-        .order_by("-rank")
-    )
 
-    result = result.annotate(
-        headline=SearchHeadline(
-            "name",
-            query,
-            start_sel='<span style="background-color: yellow;">',
-            stop_sel="</span>",
-        )
-    )
-    result = result.annotate(
-        bodyline=SearchHeadline(
-            "description",
-            query,
-            start_sel='<span style="background-color: yellow;">',
-            stop_sel="</span>",
-        )
-    )
-    return result
-    # keywords = [word for word in query.split() if len(word) > 2]
+def q_highlight(products, query):
+    if is_id_query(query):
+        return products
 
-    # q_objects = Q()
+    products = list(products)
+    if not products:
+        return products
+
+    highlighted = (
+        get_search_backend()
+        .highlight(Products.objects.filter(id__in=[product.id for product in products]), query)
+        .values("id", "headline", "bodyline")
+    )
+    lines = {row["id"]: row for row in highlighted}
 
-    # for token in keywords:
-    #     q_objects |= Q(description__icontains=token)
-    #     q_objects |= Q(name__icontains=token)
+    for product in products:
+        row = lines.get(product.id)
+        if row:
+            product.headline = row["headline"]
+            product.bodyline = row["bodyline"]
 
-    # return Products.objects.filter(q_objects)
+    return products
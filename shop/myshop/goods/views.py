@@ -1,11 +1,21 @@
+from django.conf import settings
 from django.http import Http404
 from django.views.generic import DetailView, ListView
 
+from common.mixins import PageCacheMixin
+from goods.cache import (
+    get_cached_results,
+    get_catalog_version,
+    get_categories_version,
+    get_product_last_modified,
+    get_product_version,
+)
 from goods.models import Products
-from goods.utils import q_search
+from goods.paginators import InvalidCursor, KeysetPage, KeysetPaginator
+from goods.utils import q_highlight, q_search
 
 
-class CatalogView(ListView):
+class CatalogView(PageCacheMixin, ListView):
     model = Products
     # queryset = Products.objects.all().order_by("-id")
     template_name = "goods/catalog.html"
@@ -14,6 +24,46 @@ class CatalogView(ListView):
     allow_empty = False
     # чтоб удобно передать в методы
     slug_url_kwarg = "category_slug"
+    cursor_kwarg = "cursor"
+    page_cache_params = ("q", "on_sale", "order_by", "page", cursor_kwarg)
+    # the price a buyer sees is the stored price with the discount
+    orderings = {
+        "price": "sell_price",
+        "-price": "-sell_price",
+    }
+    # order_by -> columns to seek on, the last one has to be unique
+    keyset_orderings = {
+        "default": ("id",),
+        "price": ("sell_price", "id"),
+        "-price": ("-sell_price", "-id"),
+    }
+
+    def get_page_cache_versions(self):
+        return (get_categories_version(), get_catalog_version())
+
+    def get_keyset_ordering(self):
+        if not getattr(settings, "CATALOG_KEYSET_PAGINATION", False):
+            return None
+
+        order_by = self.request.GET.get("order_by") or "default"
+        # search results are ordered by rank by default, seek on it makes no sense
+        if self.request.GET.get("q") and order_by == "default":
+            return None
+
+        return self.keyset_orderings.get(order_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if ordering is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_queryset(self):
         category_slug = self.kwargs.get(self.slug_url_kwarg)
@@ -23,18 +73,23 @@ class CatalogView(ListView):
 
         if category_slug == "all":
             goods = super().get_queryset()
+            query = None
         elif query:
             goods = q_search(query)
         else:
+            # an unknown or empty category ends up as 404 anyway,
+            # because of allow_empty = False
             goods = super().get_queryset().filter(category__slug=category_slug)
-            if not goods.exists():
-                raise Http404()
 
         if on_sale:
             goods = goods.filter(discount__gt=0)
 
         if order_by and order_by != "default":
-            goods = goods.order_by(order_by)
+            goods = goods.order_by(self.orderings.get(order_by, order_by))
+
+        # keyset pages are cheap as they are, the cache is for the offset mode
+        if self.get_keyset_ordering() is None:
+            goods = get_cached_results(goods, query, category_slug, on_sale, order_by)
 
         return goods
     
@@ -42,10 +97,16 @@ class CatalogView(ListView):
         context = super().get_context_data(**kwargs)
         context["title"] = "Home - Каталог"
         context["slug_url"] = self.kwargs.get(self.slug_url_kwarg)
+        context["keyset_pagination"] = isinstance(context.get("page_obj"), KeysetPage)
+
+        query = self.request.GET.get("q")
+        if query:
+            # ts_headline/snippet only for the rows of the current page
+            q_highlight(context[self.context_object_name], query)
         return context
 
 
-class ProductView(DetailView):
+class ProductView(PageCacheMixin, DetailView):
 
     # model = Products
     # slug_field = "slug"
@@ -53,6 +114,12 @@ class ProductView(DetailView):
     slug_url_kwarg = "product_slug"
     context_object_name = "product"
 
+    def get_page_cache_versions(self):
+        return (get_categories_version(), get_product_version(self.kwargs.get(self.slug_url_kwarg)))
+
+    def get_page_last_modified(self):
+        return get_product_last_modified(self.kwargs.get(self.slug_url_kwarg))
+
     def get_object(self, queryset=None):
         product = Products.objects.get(slug=self.kwargs.get(self.slug_url_kwarg))
         return product
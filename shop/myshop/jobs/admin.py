@@ -0,0 +1,18 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "attempts", "max_attempts", "run_at", "created_timestamp"]
+    list_filter = ["status", "name"]
+    readonly_fields = ["locked_by", "locked_at", "last_error", "created_timestamp"]
+    actions = ["retry"]
+
+    @admin.action(description="Повторить выбранные задачи")
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), last_error="",
+        )
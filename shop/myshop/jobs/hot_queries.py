@@ -0,0 +1,15 @@
+from django.utils import timezone
+
+from common.explain import hot_query
+from jobs.models import Job
+
+
+@hot_query("jobs:claim")
+def due_jobs():
+    # the poll of run_jobs, once per --poll seconds
+    return Job.objects.due(timezone.now()).order_by("run_at", "id").values_list("id", flat=True)[:4]
+
+
+@hot_query("jobs:stale")
+def stale_jobs():
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now())
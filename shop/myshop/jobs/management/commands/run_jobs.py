@@ -0,0 +1,70 @@
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import run_job
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых задач: берет задачи из таблицы job и выполняет их в пуле потоков"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOBS_WORKERS, help="потоков в пуле")
+        parser.add_argument("--poll", type=float, default=1.0, help="пауза, когда задач нет, секунд")
+        parser.add_argument("--once", action="store_true", help="выполнить готовые задачи и выйти")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = timedelta(seconds=settings.JOBS_STALE_AFTER)
+        # a few heartbeats per JOBS_STALE_AFTER, a missed one doesn't make
+        # the jobs of a live worker stale
+        heartbeat_every = stale_after.total_seconds() / 3
+        last_heartbeat = time.monotonic()
+        running = set()
+        done = failed = 0
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        try:
+            while True:
+                if running and time.monotonic() - last_heartbeat >= heartbeat_every:
+                    Job.objects.heartbeat(worker)
+                    last_heartbeat = time.monotonic()
+                Job.objects.requeue_stale(timezone.now() - stale_after)
+                free = workers - len(running)
+                if free:
+                    running.update(pool.submit(self.run, job) for job in Job.objects.claim(worker, free))
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+
+                finished, running = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.result():
+                        done += 1
+                    else:
+                        failed += 1
+        except KeyboardInterrupt:
+            self.stdout.write("Остановка, ждем выполняемые задачи")
+        finally:
+            pool.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Выполнено задач: {done}, с ошибкой: {failed}"))
+
+    def run(self, job):
+        # every thread has its own connection, the stale ones are closed
+        close_old_connections()
+        try:
+            return run_job(job)
+        finally:
+            close_old_connections()
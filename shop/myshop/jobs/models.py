@@ -0,0 +1,74 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class JobQueryset(models.QuerySet):
+
+    def due(self, now=None):
+        return self.filter(status=Job.QUEUED, run_at__lte=now or timezone.now())
+
+    def claim(self, worker, limit):
+        # a conditional UPDATE takes only the rows still queued, so two
+        # workers never get the same job; the claim is told apart by
+        # locked_at here and by the attempt number later (run_job)
+        now = timezone.now()
+        ids = list(self.due(now).order_by("run_at", "id").values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        self.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        return list(self.filter(id__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+    def heartbeat(self, worker):
+        # a running worker renews the claims of its jobs, however long they
+        # take they are not stale
+        return self.filter(status=Job.RUNNING, locked_by=worker).update(locked_at=timezone.now())
+
+    def requeue_stale(self, locked_before):
+        # a worker died with these jobs (no heartbeat since locked_before),
+        # they are retried like a failure
+        stale = self.filter(status=Job.RUNNING, locked_at__lt=locked_before)
+        stale.filter(attempts__gte=F("max_attempts")).update(
+            status=Job.FAILED, locked_by="", locked_at=None, last_error="Воркер не завершил задачу",
+        )
+        return stale.update(status=Job.QUEUED, locked_by="", locked_at=None, run_at=timezone.now())
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (FAILED, "Ошибка"),
+    ]
+
+    # a function of jobs.queue.TASKS, done jobs are deleted
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    args = models.JSONField(default=list, blank=True, verbose_name="Аргументы")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запустить после")
+    locked_by = models.CharField(max_length=100, blank=True, default="", verbose_name="Воркер")
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name="Взята в работу")
+    last_error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    created_timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        db_table = "job"
+        verbose_name = "Задачу"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ("id",)
+        indexes = [
+            # the poll of the worker: queued jobs in run_at order
+            models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+        ]
+
+    objects = JobQueryset.as_manager()
+
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} | {self.get_status_display()}"
@@ -0,0 +1,74 @@
+import logging
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+logger = logging.getLogger("myshop.jobs")
+
+# Functions the worker runs (manage.py run_jobs), registered in the tasks.py
+# modules of the apps. Arguments go through JSON: ids and file names, not
+# model instances; a task may run more than once and has to be idempotent.
+Task = namedtuple("Task", ["name", "func", "max_attempts", "retry_delay"])
+
+TASKS = {}
+
+
+def task(name, max_attempts=3, retry_delay=30):
+    def decorator(func):
+        TASKS[name] = Task(name, func, max_attempts, retry_delay)
+        return func
+
+    return decorator
+
+
+def enqueue(name, *args, delay=0):
+    # the row is written in the caller's transaction: the job exists only if
+    # the change that needs it is committed, and no worker sees it earlier
+    if name not in TASKS:
+        raise ValueError(f"Неизвестная задача: {name}")
+    if settings.JOBS_EAGER:
+        # without a worker (tests, development): right after the commit
+        transaction.on_commit(lambda: run_eager(name, args))
+        return None
+    return Job.objects.create(
+        name=name, args=list(args), max_attempts=TASKS[name].max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def run_eager(name, args):
+    try:
+        TASKS[name].func(*args)
+    except Exception:
+        logger.exception("Задача %s%s не выполнена", name, tuple(args))
+
+
+def run_job(job):
+    # a claimed job (Job.objects.claim): deleted when done, a failure is
+    # retried after retry_delay * 2 ** (attempt - 1) until max_attempts
+    # the attempt number tells this claim apart, locked_at is renewed while
+    # the job runs (manage.py run_jobs)
+    claimed = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts)
+    task = TASKS.get(job.name)
+    try:
+        if task is None:
+            raise LookupError(f"Неизвестная задача: {job.name}")
+        task.func(*job.args)
+    except Exception:
+        logger.warning("Задача %s #%s не выполнена, попытка %s", job.name, job.pk, job.attempts, exc_info=True)
+        retry_delay = task.retry_delay if task else 0
+        claimed.update(
+            status=Job.FAILED if job.attempts >= job.max_attempts else Job.QUEUED,
+            run_at=timezone.now() + timedelta(seconds=retry_delay * 2 ** (job.attempts - 1)),
+            locked_by="", locked_at=None, last_error=traceback.format_exc()[-5000:],
+        )
+        return False
+    claimed.delete()
+    return True
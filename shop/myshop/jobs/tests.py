@@ -0,0 +1,258 @@
+import os
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from common.testing import TempMediaMixin
+from goods.models import Categories, Products
+from goods.tasks import make_product_thumbnails
+from goods.thumbnails import THUMBNAIL_FORMATS, ready_marker_name, thumbnail_name, thumbnail_widths
+from jobs.models import Job, JobQueryset
+from jobs.queue import enqueue, run_job, task
+from users.models import User
+from users.tasks import process_avatar
+
+
+CALLS = []
+
+
+@task("tests.echo", max_attempts=3, retry_delay=10)
+def echo(value):
+    CALLS.append(value)
+    if value == "fail":
+        raise RuntimeError("не получилось")
+
+
+@task("tests.slow")
+def slow(value):
+    time.sleep(0.5)
+    CALLS.append(value)
+
+
+def image_file(name, size=(1200, 900), image_format="JPEG", exif=None):
+    buffer = BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, image_format, **({"exif": exif} if exif else {}))
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{image_format.lower()}")
+
+
+class JobsTestMixin(TempMediaMixin):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        CALLS.clear()
+
+
+class QueueTests(JobsTestMixin, TestCase):
+
+    def test_enqueue(self):
+        job = enqueue("tests.echo", "a", delay=60)
+        self.assertEqual((job.name, job.args, job.status, job.max_attempts), ("tests.echo", ["a"], Job.QUEUED, 3))
+        self.assertGreater(job.run_at, timezone.now())
+        # not due yet
+        self.assertEqual(Job.objects.claim("worker", 10), [])
+        with self.assertRaises(ValueError):
+            enqueue("tests.unknown")
+
+    def test_claimed_once(self):
+        enqueue("tests.echo", "a")
+        enqueue("tests.echo", "b")
+        claimed = Job.objects.claim("worker-1", 10)
+        self.assertEqual([job.args for job in claimed], [["a"], ["b"]])
+        self.assertEqual({(job.status, job.attempts, job.locked_by) for job in claimed}, {(Job.RUNNING, 1, "worker-1")})
+        # the second worker finds nothing queued
+        self.assertEqual(Job.objects.claim("worker-2", 10), [])
+
+    def test_claim_lost_race(self):
+        # the ids were read, but another worker's UPDATE got the row first
+        job = enqueue("tests.echo", "a")
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, locked_by="worker-2", locked_at=timezone.now())
+        with mock.patch.object(JobQueryset, "due", lambda queryset, now=None: queryset.all()):
+            self.assertEqual(Job.objects.claim("worker-1", 10), [])
+        self.assertEqual(Job.objects.get().locked_by, "worker-2")
+
+    def test_done_job_deleted(self):
+        enqueue("tests.echo", "a")
+        self.assertTrue(run_job(Job.objects.claim("worker", 1)[0]))
+        self.assertEqual(CALLS, ["a"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_retry_backoff_then_failed(self):
+        enqueue("tests.echo", "fail")
+        delays = []
+        for attempt in range(1, 4):
+            Job.objects.update(run_at=timezone.now())
+            job = Job.objects.claim("worker", 1)[0]
+            self.assertEqual(job.attempts, attempt)
+            before = timezone.now()
+            with self.assertLogs("myshop.jobs", "WARNING"):
+                self.assertFalse(run_job(job))
+            job.refresh_from_db()
+            delays.append(round((job.run_at - before).total_seconds()))
+            self.assertIn("не получилось", job.last_error)
+            self.assertEqual(job.locked_by, "")
+
+        # retry_delay * 2 ** (attempt - 1); the last failure is final
+        self.assertEqual(delays[:2], [10, 20])
+        self.assertEqual(job.status, Job.FAILED)
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(Job.objects.claim("worker", 1), [])
+
+    def test_requeue_stale(self):
+        enqueue("tests.echo", "a")
+        enqueue("tests.echo", "b")
+        Job.objects.claim("dead", 10)
+        Job.objects.filter(args=["b"]).update(attempts=3)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(Job.objects.requeue_stale(timezone.now() - timedelta(minutes=10)), 1)
+        self.assertEqual(Job.objects.get(args=["a"]).status, Job.QUEUED)
+        self.assertEqual(Job.objects.get(args=["b"]).status, Job.FAILED)
+        # a job of a live worker stays where it is
+        Job.objects.claim("alive", 10)
+        self.assertEqual(Job.objects.requeue_stale(timezone.now() - timedelta(minutes=10)), 0)
+
+    def test_heartbeat(self):
+        enqueue("tests.echo", "a")
+        job = Job.objects.claim("worker", 1)[0]
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(Job.objects.heartbeat("other"), 0)
+        self.assertEqual(Job.objects.heartbeat("worker"), 1)
+        self.assertEqual(Job.objects.requeue_stale(timezone.now() - timedelta(minutes=10)), 0)
+        # the renewed claim is still the job's own
+        self.assertTrue(run_job(job))
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertIsNone(enqueue("tests.echo", "a"))
+            self.assertEqual(CALLS, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(CALLS, ["a"])
+        self.assertFalse(Job.objects.exists())
+
+        # a failure is logged, the request that queued it goes on
+        with self.assertLogs("myshop.jobs", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue("tests.echo", "fail")
+
+
+class ImageTaskTests(JobsTestMixin, TestCase):
+
+    def test_product_thumbnails(self):
+        category = Categories.objects.create(name="Кухня", slug="kuhnya")
+        product = Products.objects.create(name="Стол", slug="stol", category=category, image=image_file("stol.jpg"))
+        # the request only queues the job
+        self.assertEqual(product.image_hash, "")
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args), ("goods.make_thumbnails", [product.pk, product.image.name]))
+
+        make_product_thumbnails(*job.args)
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_hash), 40)
+        for width in thumbnail_widths():
+            for image_format, extension in THUMBNAIL_FORMATS:
+                path = os.path.join(self.media_root, thumbnail_name(product.image_hash, width, extension))
+                self.assertEqual(Image.open(path).size[0], width)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, ready_marker_name(product.image_hash))))
+
+    def test_product_image_replaced_meanwhile(self):
+        category = Categories.objects.create(name="Кухня", slug="kuhnya")
+        product = Products.objects.create(name="Стол", slug="stol", category=category, image=image_file("stol.jpg"))
+        old_name = product.image.name
+        product.image = image_file("stol_2.jpg")
+        product.save()
+
+        # the job of the old image does nothing, the new one has its own job
+        make_product_thumbnails(product.pk, old_name)
+        product.refresh_from_db()
+        self.assertEqual(product.image_hash, "")
+        self.assertEqual(Job.objects.filter(name="goods.make_thumbnails").count(), 2)
+
+    def test_avatar(self):
+        exif = Image.Exif()
+        # rotated 90°, and a camera to strip
+        exif[0x0112] = 6
+        exif[0x010F] = "Camera"
+        user = User.objects.create_user("user", password="password")
+        user.image = image_file("me.jpg", size=(1600, 1200), exif=exif)
+        user.save()
+        self.assertFalse(user.image_ready)
+        original = user.image.name
+
+        process_avatar(user.pk, original)
+        user.refresh_from_db()
+        self.assertTrue(user.image_ready)
+        self.assertRegex(user.image.name, rf"^users_images/avatar_{user.pk}_[0-9a-f]{{16}}\.jpg$")
+        avatar = Image.open(os.path.join(self.media_root, user.image.name))
+        self.assertEqual(avatar.size, (192, 256))
+        self.assertEqual(len(avatar.getexif()), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, original)))
+
+        # saving the profile again queues nothing
+        Job.objects.all().delete()
+        user.first_name = "Иван"
+        user.save()
+        self.assertFalse(Job.objects.exists())
+
+        # the processed avatar uploaded again: the name doesn't grow
+        with open(os.path.join(self.media_root, user.image.name), "rb") as file:
+            user.image = SimpleUploadedFile(os.path.basename(user.image.name), file.read())
+        user.save()
+        process_avatar(user.pk, user.image.name)
+        user.refresh_from_db()
+        self.assertRegex(user.image.name, rf"^users_images/avatar_{user.pk}_[0-9a-f]{{16}}\.jpg$")
+
+    def test_avatar_replaced_meanwhile(self):
+        user = User.objects.create_user("user", password="password")
+        user.image = image_file("first.jpg")
+        user.save()
+        old_name = user.image.name
+        user.image = image_file("second.jpg")
+        user.save()
+
+        process_avatar(user.pk, old_name)
+        user.refresh_from_db()
+        self.assertFalse(user.image_ready)
+        self.assertNotEqual(user.image.name, old_name)
+
+
+class WorkerCommandTests(JobsTestMixin, TransactionTestCase):
+    # the worker threads have their own connections, they need committed rows
+
+    def test_run_jobs(self):
+        user = User.objects.create_user("user", password="password")
+        user.image = image_file("me.png", image_format="PNG")
+        user.save()
+        enqueue("tests.echo", "a")
+        enqueue("tests.echo", "fail")
+
+        out = StringIO()
+        with self.assertLogs("myshop.jobs", "WARNING"):
+            call_command("run_jobs", "--once", "--workers", "2", stdout=out)
+        self.assertIn("Выполнено задач: 2, с ошибкой: 1", out.getvalue())
+
+        user.refresh_from_db()
+        self.assertTrue(user.image_ready)
+        failed = Job.objects.get()
+        self.assertEqual((failed.args, failed.status, failed.attempts), (["fail"], Job.QUEUED, 1))
+
+    @override_settings(JOBS_STALE_AFTER=0.3)
+    def test_long_job_not_requeued(self):
+        # runs longer than JOBS_STALE_AFTER: the heartbeat keeps it from
+        # being taken for lost and run a second time meanwhile
+        enqueue("tests.slow", "a")
+        out = StringIO()
+        call_command("run_jobs", "--once", "--workers", "2", "--poll", "0.05", stdout=out)
+        self.assertIn("Выполнено задач: 1, с ошибкой: 0", out.getvalue())
+        self.assertEqual(CALLS, ["a"])
+        self.assertFalse(Job.objects.exists())
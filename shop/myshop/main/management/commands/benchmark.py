@@ -0,0 +1,271 @@
+import itertools
+import json
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from carts.models import Cart
+from goods.models import Categories, Products
+from users.models import User
+
+
+FIXTURES_DIR = settings.BASE_DIR / "fixtures" / "goods"
+DEFAULT_BASELINE = settings.BASE_DIR / "benchmark_baseline.json"
+
+ORDER_DATA = {
+    "first_name": "Иван",
+    "last_name": "Иванов",
+    "phone_number": "9001234567",
+    "requires_delivery": "0",
+    "delivery_address": "",
+    "payment_on_get": "1",
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный бенчмарк магазина на отдельной тестовой БД: p50/p95 и число "
+        "запросов к БД по каждому endpoint, сравнение с baseline-файлом"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=6)
+        parser.add_argument("--products", type=int, default=300)
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--requests", type=int, default=30, help="замеров на endpoint")
+        parser.add_argument("--warmup", type=int, default=3, help="незамеряемых запросов на endpoint")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument("--save-baseline", action="store_true")
+        parser.add_argument(
+            "--tolerance", type=float, default=1.0,
+            help="допустимый рост p50 относительно baseline (1.0 = +100%%)",
+        )
+        parser.add_argument(
+            "--min-delta", type=float, default=10.0,
+            help="рост p50 меньше этого числа миллисекунд считается шумом",
+        )
+        parser.add_argument("--output", help="записать результаты в JSON")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            cache.clear()
+            self.seed(options["categories"], options["products"], options["users"])
+            # the anonymous client would be served from the full-page cache
+            # after the warmup, the benchmark times the views themselves
+            with override_settings(PAGE_CACHE_TIMEOUT=0):
+                results = self.run_scenarios(options["requests"], options["warmup"])
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        self.report(results)
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+
+        baseline = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline сохранен в {baseline}"))
+        elif baseline.exists():
+            self.compare(
+                results, json.loads(baseline.read_text()), options["tolerance"], options["min_delta"]
+            )
+
+    def seed(self, categories_count, products_count, users_count):
+        # the shape (names, descriptions, prices, discounts, images) comes from the fixtures
+        fixture_categories = [
+            row["fields"] for row in json.loads((FIXTURES_DIR / "categories.json").read_text())
+        ]
+        fixture_products = [
+            row["fields"] for row in json.loads((FIXTURES_DIR / "products.json").read_text())
+        ]
+
+        # fixture slugs are kept for the first round, so "all" is there too
+        categories = Categories.objects.bulk_create([
+            Categories(
+                name=f"{fields['name']} {index}",
+                slug=fields["slug"] if index < len(fixture_categories) else f"{fields['slug']}-{index}",
+            )
+            for index, fields in zip(range(categories_count), itertools.cycle(fixture_categories))
+        ])
+
+        Products.objects.bulk_create([
+            Products(
+                name=f"{fields['name']} {index}",
+                slug=f"{fields['slug']}-{index}",
+                description=fields["description"],
+                image=fields["image"],
+                price=fields["price"],
+                discount=fields["discount"],
+                quantity=1_000_000,
+                category=categories[index % len(categories)],
+            )
+            for index, fields in zip(range(products_count), itertools.cycle(fixture_products))
+        ])
+
+        # one hash for everybody, hashing a password per user would dominate the seed
+        password = make_password("benchmark")
+        User.objects.bulk_create([
+            User(username=f"bench_user_{index}", password=password) for index in range(users_count)
+        ])
+
+        self.categories = list(Categories.objects.values_list("slug", flat=True))
+        self.products = list(Products.objects.values_list("id", "slug"))
+        self.search_words = sorted({
+            word for fields in fixture_products for word in fields["name"].split() if len(word) > 3
+        })
+
+        self.clients = []
+        for user in User.objects.filter(username__startswith="bench_user_"):
+            client = Client()
+            client.force_login(user)
+            self.clients.append((client, user))
+        self.anonymous = Client()
+
+    def scenarios(self):
+        # a scenario prepares the data (random choices, the cart to change)
+        # and returns the request, only the request is measured
+        def catalog():
+            slug = self.random.choice(self.categories)
+            page = self.random.randint(1, 3)
+            return lambda: self.anonymous.get(reverse("catalog:index", args=[slug]), {"page": page})
+
+        def catalog_sorted():
+            page = self.random.randint(1, 3)
+            return lambda: self.anonymous.get(
+                reverse("catalog:index", args=["all"]),
+                {"order_by": "price", "on_sale": "on", "page": page},
+            )
+
+        def search():
+            word = self.random.choice(self.search_words)
+            return lambda: self.anonymous.get(reverse("catalog:search"), {"q": word})
+
+        def product():
+            slug = self.random.choice(self.products)[1]
+            return lambda: self.anonymous.get(reverse("catalog:product", args=[slug]))
+
+        def cart_add():
+            client, user = self.random.choice(self.clients)
+            product_id = self.random.choice(self.products)[0]
+            return lambda: client.post(reverse("cart:cart_add"), {"product_id": product_id})
+
+        def cart_change():
+            client, user = self.random.choice(self.clients)
+            cart = self.prepare_cart(user, 1)[0]
+            return lambda: client.post(reverse("cart:cart_change"), {"cart_id": cart.id, "quantity": 3})
+
+        def cart_remove():
+            client, user = self.random.choice(self.clients)
+            cart = self.prepare_cart(user, 1)[0]
+            return lambda: client.post(reverse("cart:cart_remove"), {"cart_id": cart.id})
+
+        def checkout():
+            client, user = self.random.choice(self.clients)
+            self.prepare_cart(user, 3)
+            return lambda: client.post(reverse("orders:create_order"), ORDER_DATA)
+
+        def profile():
+            client, user = self.random.choice(self.clients)
+            return lambda: client.get(reverse("user:profile"))
+
+        return {
+            "catalog:index": catalog,
+            "catalog:index?order_by=price&on_sale": catalog_sorted,
+            "catalog:search": search,
+            "catalog:product": product,
+            "cart:cart_add": cart_add,
+            "cart:cart_change": cart_change,
+            "cart:cart_remove": cart_remove,
+            "orders:create_order": checkout,
+            "user:profile": profile,
+        }
+
+    def prepare_cart(self, user, lines):
+        # setup of a scenario: puts `lines` products into the user's cart
+        Cart.objects.filter(user=user).delete()
+        return Cart.objects.bulk_create([
+            Cart(user=user, product_id=product_id, quantity=1)
+            for product_id, slug in self.random.sample(self.products, lines)
+        ])
+
+    def run_scenarios(self, requests, warmup):
+        results = {}
+        for name, scenario in self.scenarios().items():
+            for _ in range(warmup):
+                scenario()()
+
+            timings, queries = [], []
+            for _ in range(requests):
+                request = scenario()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - started
+
+                if response.status_code >= 400:
+                    raise CommandError(f"{name}: HTTP {response.status_code}")
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+
+            results[name] = {
+                "requests": requests,
+                "p50_ms": round(percentile(timings, 50), 2),
+                "p95_ms": round(percentile(timings, 95), 2),
+                "queries_p50": percentile(queries, 50),
+                "queries_max": max(queries),
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':42} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'max':>5}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:42} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} "
+                f"{row['queries_p50']:8} {row['queries_max']:5}"
+            )
+
+    def compare(self, results, baseline, tolerance, min_delta):
+        regressions = []
+        for name, row in results.items():
+            expected = baseline.get(name)
+            if not expected:
+                continue
+            if row["queries_max"] > expected["queries_max"]:
+                regressions.append(
+                    f"{name}: запросов {row['queries_max']} > {expected['queries_max']}"
+                )
+            # p95 of a few dozen samples is one or two requests, a single
+            # scheduler hiccup moves it, so the run fails on the median only
+            allowed = max(expected["p50_ms"] * (1 + tolerance), expected["p50_ms"] + min_delta)
+            if row["p50_ms"] > allowed:
+                regressions.append(
+                    f"{name}: p50 {row['p50_ms']} ms > {expected['p50_ms']} ms (+{tolerance:.0%})"
+                )
+
+        if regressions:
+            raise CommandError("Регрессия производительности:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Регрессий относительно baseline нет"))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.runner import DiscoverRunner
+from django.utils.module_loading import autodiscover_modules
+
+from common.explain import HOT_QUERIES, find_scans
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN горячих запросов приложений (hot_queries.py): падает, если "
+        "какой-то из них читает таблицу целиком"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="только эти запросы")
+        parser.add_argument(
+            "--test-db", action="store_true",
+            help="на отдельной тестовой БД со всеми миграциями, а не на рабочей",
+        )
+        parser.add_argument("--plans", action="store_true", help="вывести планы целиком")
+
+    def handle(self, *args, **options):
+        autodiscover_modules("hot_queries")
+        unknown = set(options["names"]) - set(HOT_QUERIES)
+        if unknown:
+            raise CommandError(f"Нет таких запросов: {', '.join(sorted(unknown))}")
+        queries = [
+            query for name, query in HOT_QUERIES.items()
+            if name in options["names"] or not options["names"]
+        ]
+
+        if not options["test_db"]:
+            flagged = self.explain(queries, options["plans"])
+        else:
+            runner = DiscoverRunner(verbosity=0, interactive=False)
+            old_config = runner.setup_databases()
+            try:
+                flagged = self.explain(queries, options["plans"])
+            finally:
+                runner.teardown_databases(old_config)
+
+        if flagged:
+            raise CommandError("Полное чтение таблиц:\n" + "\n".join(flagged))
+        self.stdout.write(self.style.SUCCESS(f"Проверено запросов: {len(queries)}, полных чтений нет"))
+
+    def explain(self, queries, show_plans):
+        flagged = []
+        for query in queries:
+            with transaction.atomic():
+                if connection.vendor == "postgresql":
+                    # an empty or small table is read in full whatever the
+                    # indexes are, the plan has to show what they allow
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+                plan = query.build().explain()
+
+            scans = [table for table in find_scans(plan, connection.vendor) if table not in query.allow_scan]
+            status = self.style.ERROR("SCAN " + ", ".join(scans)) if scans else self.style.SUCCESS("OK")
+            self.stdout.write(f"{query.name:45} {status}")
+            if show_plans or scans:
+                self.stdout.write(plan)
+            if scans:
+                flagged.append(f"{query.name}: {', '.join(scans)}")
+        return flagged
@@ -1,3 +1,19 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from common.testing import QueryBudgetMixin
+from users.models import User
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    fixtures = ["fixtures/goods/categories.json"]
+
+    def test_anonymous(self):
+        self.assertWithinBudget("main:index")
+        self.assertWithinBudget("main:about")
+
+    def test_user(self):
+        self.client.force_login(User.objects.create_user("user", password="password"))
+        self.assertWithinBudget("main:index")
+        cache.clear()
+        self.assertWithinBudget("main:about")
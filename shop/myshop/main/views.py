@@ -2,11 +2,18 @@ from django.http import HttpResponse
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from common.mixins import PageCacheMixin
+from goods.cache import get_categories_version
 from goods.models import Categories
 
 
+class CategoriesPageCacheMixin(PageCacheMixin):
+    # static pages, only the categories menu in them changes
+    def get_page_cache_versions(self):
+        return (get_categories_version(),)
 
-class IndexView(TemplateView):
+
+class IndexView(CategoriesPageCacheMixin, TemplateView):
     template_name = 'main/index.html'
 
     def get_context_data(self, **kwargs):
@@ -16,7 +23,7 @@ class IndexView(TemplateView):
         return context
 
 
-class AboutView(TemplateView):
+class AboutView(CategoriesPageCacheMixin, TemplateView):
     template_name = 'main/about.html'
 
     def get_context_data(self, **kwargs):
@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myshop.settings')
 
 application = get_asgi_application()
+
+# fill the per-process caches before the first request hits this worker
+from django.db import DatabaseError  # noqa: E402
+from goods.cache import warm_up  # noqa: E402
+
+try:
+    warm_up()
+except DatabaseError:
+    pass
@@ -45,15 +45,18 @@ INSTALLED_APPS = [
     'users',
     'carts',
     'orders',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'common.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'carts.middleware.CookieCartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -131,6 +134,24 @@ MEDIA_URL = 'media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Product image thumbnails (goods.thumbnails): WebP and JPEG of each width,
+# in MEDIA_ROOT/THUMBNAILS_DIR/<sha1 of the image>/
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_QUALITY = 80
+THUMBNAILS_DIR = 'thumbnails'
+# avatars are resized to fit AVATAR_SIZE px and saved as JPEG without EXIF (users.tasks)
+AVATAR_SIZE = 256
+AVATAR_QUALITY = 85
+
+# Background jobs (jobs.queue), run by `manage.py run_jobs`: JOBS_WORKERS
+# threads; a running job whose worker has not renewed its claim for
+# JOBS_STALE_AFTER seconds (the worker died) is taken for lost and retried.
+# JOBS_EAGER runs the jobs right after the commit in the process that made
+# them (tests, development without a worker)
+JOBS_WORKERS = 4
+JOBS_STALE_AFTER = 60 * 10
+JOBS_EAGER = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -144,3 +165,62 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
 LOGIN_URL = '/user/login/'
 LOGIN_REDIRECT_URL = '/'
+
+# Seek (cursor) pagination in the catalog: no COUNT(*) and no OFFSET,
+# only next/prev links are rendered
+CATALOG_KEYSET_PAGINATION = False
+
+# Hold stock for carts: seconds a cart line keeps its quantity reserved,
+# None - no holds, stock is only checked at checkout.
+# Expired holds are released by `manage.py release_reservations`
+CART_RESERVATION_TTL = None
+
+# Anonymous carts: "session" - Cart rows of the session, the session is
+# created with the first product; "cookie" - up to CART_COOKIE_MAX_LINES
+# lines in a signed cookie, no session and no rows (and no stock holds)
+# until login or a bigger cart. Either one becomes the user's cart on login
+ANONYMOUS_CART_STORAGE = "session"
+CART_COOKIE_NAME = "cart"
+CART_COOKIE_MAX_LINES = 20
+CART_COOKIE_AGE = 60 * 60 * 24 * 14
+
+# Full-page cache of the catalog, product, index and about pages for
+# anonymous visitors, seconds; 0 - off. Pages are purged by the catalog,
+# categories and per-product versions (goods.cache), the same versions
+# give the pages their ETag
+PAGE_CACHE_TIMEOUT = 60 * 15
+
+# Query budgets per URL name (common.middleware.QueryBudgetMiddleware):
+# requests over the budget or repeating one SQL shape QUERY_DUPLICATES_LIMIT
+# times (N+1) are logged to "myshop.queries" with a stack sample;
+# QUERY_BUDGET_STRICT raises instead (tests, CI)
+QUERY_BUDGETS = {
+    # cold caches (categories, catalog results) included
+    "main:index": 4,
+    "main:about": 4,
+    "catalog:index": 6,
+    "catalog:search": 7,
+    "catalog:product": 5,
+    # the first product of an anonymous visitor creates the session
+    "cart:cart_add": 5,
+    "cart:cart_change": 5,
+    "cart:cart_remove": 5,
+    "cart:cart_fragment": 3,
+    "orders:create_order": 8,
+    # cold order history (orders + their items)
+    "user:profile": 6,
+    "user:users_cart": 4,
+}
+# added to QUERY_BUDGETS while the setting is on: the stock holds
+QUERY_BUDGET_EXTRAS = {
+    "CART_RESERVATION_TTL": {
+        "cart:cart_add": 4,
+        "cart:cart_change": 6,
+        "cart:cart_remove": 3,
+        "orders:create_order": 1,
+    },
+}
+QUERY_DUPLICATES_LIMIT = 3
+QUERY_BUDGET_STRICT = False
+# Server-Timing header: db, tpl and total time of the request
+QUERY_SERVER_TIMING = DEBUG
@@ -11,6 +11,15 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myshop.settings')
 
 application = get_wsgi_application()
+
+# fill the per-process caches before the first request hits this worker
+from django.db import DatabaseError  # noqa: E402
+from goods.cache import warm_up  # noqa: E402
+
+try:
+    warm_up()
+except DatabaseError:
+    pass
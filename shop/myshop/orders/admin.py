@@ -7,7 +7,8 @@ from orders.models import Order, OrderItem
 
 class OrderItemTabulareAdmin(admin.TabularInline):
     model = OrderItem
-    fields = "product", "name", "price", "quantity"
+    fields = "product", "name", "price", "quantity", "total_price"
+    readonly_fields = ("total_price",)
     search_fields = (
         "product",
         "name",
@@ -17,7 +18,7 @@ class OrderItemTabulareAdmin(admin.TabularInline):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = "order", "product", "name", "price", "quantity"
+    list_display = "order", "product", "name", "price", "quantity", "total_price"
     search_fields = (
         "order",
         "product",
@@ -54,13 +55,14 @@ class OrderAdmin(admin.ModelAdmin):
         "status",
         "payment_on_get",
         "is_paid",
+        "total_price",
         "created_timestamp",
     )
 
     search_fields = (
         "id",
     )
-    readonly_fields = ("created_timestamp",)
+    readonly_fields = ("total_price", "created_timestamp",)
     list_filter = (
         "requires_delivery",
         "status",
@@ -68,3 +70,8 @@ class OrderAdmin(admin.ModelAdmin):
         "is_paid",
     )
     inlines = (OrderItemTabulareAdmin,)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # lines edited inline change the order sum
+        Order.objects.filter(pk=form.instance.pk).update_totals()
@@ -0,0 +1,84 @@
+import hashlib
+from collections import defaultdict, namedtuple
+from threading import local
+
+from django.conf import settings
+from django.db import transaction
+
+from common.cache import bump_version, get_or_load, get_version
+from goods.paginators import KeysetPage, KeysetPaginator
+
+
+ORDERS_VERSION_KEY = "orders:version:{user_id}"
+ORDERS_PAGE_KEY = "orders:page:{user_id}:{version}:{cursor}"
+ORDERS_METRICS = "orders:page"
+
+OrderRow = namedtuple("OrderRow", ["id", "created_timestamp", "status", "total_price", "items"])
+# product_id is None once the product is deleted; the defaults read rows
+# cached before the link was stored
+OrderItemRow = namedtuple(
+    "OrderItemRow", ["name", "price", "quantity", "total_price", "product_id", "product_slug"],
+    defaults=(None, ""),
+)
+
+
+def get_orders_version(user_id):
+    return get_version(ORDERS_VERSION_KEY.format(user_id=user_id))
+
+
+# bumps waiting for the commit, per thread and database: the saves of one
+# transaction (lines of an order edited inline) bump a version once
+_pending = local()
+
+
+def bump_orders_version(user_id, using=None):
+    # after commit, so a page rendered meanwhile can't be cached under the new version
+    key = ORDERS_VERSION_KEY.format(user_id=user_id)
+    connection = transaction.get_connection(using)
+    pending = _pending.__dict__.setdefault(connection.alias, {})
+    waiting = pending.get(key)
+    # not run yet, and not dropped with a rolled back savepoint
+    if waiting is not None and any(func is waiting for sids, func, robust in connection.run_on_commit):
+        return
+
+    def bump():
+        pending.pop(key, None)
+        bump_version(key)
+
+    pending[key] = bump
+    transaction.on_commit(bump, using=using)
+
+
+def get_orders_page(user_id, cursor=None, per_page=10):
+    # one keyset page of the order history, cached as plain tuples;
+    # raises goods.paginators.InvalidCursor for a broken cursor
+    cursor_hash = hashlib.md5((cursor or "").encode()).hexdigest()
+    key = ORDERS_PAGE_KEY.format(
+        user_id=user_id, version=get_orders_version(user_id), cursor=f"{per_page}:{cursor_hash}"
+    )
+
+    def load():
+        from orders.models import Order, OrderItem
+
+        orders = Order.objects.filter(user_id=user_id).values_list(
+            "id", "created_timestamp", "status", "total_price", named=True
+        )
+        page = KeysetPaginator(orders, per_page, ("-id",)).page(cursor)
+
+        items = defaultdict(list)
+        for order_id, *item in OrderItem.objects.filter(order_id__in=[order.id for order in page]).values_list(
+            "order_id", "name", "price", "quantity", "total_price", "product_id", "product_slug"
+        ):
+            items[order_id].append(OrderItemRow(*item))
+
+        return (
+            [OrderRow(*order, items=tuple(items[order.id])) for order in page],
+            page.next_cursor,
+            page.previous_cursor,
+        )
+
+    cached = get_or_load(
+        key, load, getattr(settings, "ORDERS_CACHE_TIMEOUT", 60 * 60), metrics=ORDERS_METRICS
+    )
+    orders, next_cursor, previous_cursor = cached
+    return KeysetPage(orders, None, next_cursor, previous_cursor)
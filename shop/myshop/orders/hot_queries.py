@@ -0,0 +1,12 @@
+from common.explain import hot_query
+from orders.models import Order, OrderItem
+
+
+@hot_query("orders:history")
+def order_history():
+    return Order.objects.filter(user_id=1).order_by("-id")[:11]
+
+
+@hot_query("orders:history_items")
+def order_history_items():
+    return OrderItem.objects.filter(order_id__in=[1, 2, 3])
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:59
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Round
+
+
+def fill_totals(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    db = schema_editor.connection.alias
+
+    OrderItem.objects.using(db).update(
+        total_price=Round(
+            F("price") * F("quantity"), 2,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+    items_total = (
+        OrderItem.objects.using(db)
+        .filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum("total_price"))
+        .values("total")
+    )
+    Order.objects.using(db).update(
+        total_price=Coalesce(
+            Subquery(items_total), Decimal("0.00"),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Общая стоимость'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
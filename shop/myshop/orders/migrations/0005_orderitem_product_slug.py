@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:07
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_product_slugs(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    Products = apps.get_model("goods", "Products")
+    db = schema_editor.connection.alias
+
+    slug = Products.objects.using(db).filter(pk=OuterRef("product_id")).values("slug")[:1]
+    OrderItem.objects.using(db).exclude(product=None).update(
+        product_slug=Coalesce(Subquery(slug), Value(""))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_user_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True, default='', editable=False, max_length=200, verbose_name='URL товара'),
+        ),
+        migrations.RunPython(fill_product_slugs, migrations.RunPython.noop),
+    ]
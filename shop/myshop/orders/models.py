@@ -1,18 +1,59 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from goods.models import Products
+from orders.cache import bump_orders_version
 
 from users.models import User
 
 
+def line_total(price, quantity):
+    return (Decimal(str(price)) * quantity).quantize(Decimal("0.01"))
+
+
 class OrderitemQueryset(models.QuerySet):
     
     def total_price(self):
-        return sum(cart.products_price() for cart in self)
+        return self.aggregate(total=Coalesce(Sum("total_price"), Decimal("0.00")))["total"]
     
     def total_quantity(self):
-        if self:
-            return sum(cart.quantity for cart in self)
-        return 0
+        return self.aggregate(total=Coalesce(Sum("quantity"), 0))["total"]
+
+
+class OrderQueryset(models.QuerySet):
+
+    def update(self, **kwargs):
+        # status changes etc. have to show up in the cached order history
+        user_ids = set(self.exclude(user=None).values_list("user_id", flat=True).distinct())
+        rows = super().update(**kwargs)
+        for user_id in user_ids:
+            bump_orders_version(user_id)
+        return rows
+
+    def totals(self):
+        # number of orders and their sum, one aggregate query
+        return self.aggregate(
+            orders=Count("id"),
+            total_price=Coalesce(Sum("total_price"), Decimal("0.00")),
+        )
+
+    def update_totals(self):
+        # recomputes Order.total_price from the stored line totals
+        items_total = (
+            OrderItem.objects.filter(order=OuterRef("pk"))
+            .values("order")
+            .annotate(total=Sum("total_price"))
+            .values("total")
+        )
+        return self.update(
+            total_price=Coalesce(
+                Subquery(items_total), Decimal("0.00"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
 
 class Order(models.Model):
     user = models.ForeignKey(to=User, on_delete=models.SET_DEFAULT, blank=True, null=True, verbose_name="Пользователь", default=None)
@@ -23,12 +64,20 @@ class Order(models.Model):
     payment_on_get = models.BooleanField(default=False, verbose_name="Оплата при получении")
     is_paid = models.BooleanField(default=False, verbose_name="Оплачено")
     status = models.CharField(max_length=50, default='В обработке', verbose_name="Статус заказа")
+    # sum of OrderItem.total_price, written at checkout
+    total_price = models.DecimalField(default=0, max_digits=12, decimal_places=2, editable=False, verbose_name="Сумма заказа")
 
     class Meta:
         db_table = "order"
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ("id",)
+        indexes = [
+            # order history: a user's orders, newest first
+            models.Index(fields=["user", "-id"], name="order_user_id_desc_idx"),
+        ]
+
+    objects = OrderQueryset.as_manager()
 
     def __str__(self):
         return f"Заказ № {self.pk} | Покупатель {self.user.first_name} {self.user.last_name}"
@@ -38,8 +87,13 @@ class OrderItem(models.Model):
     order = models.ForeignKey(to=Order, on_delete=models.CASCADE, verbose_name="Заказ")
     product = models.ForeignKey(to=Products, on_delete=models.SET_DEFAULT, null=True, verbose_name="Продукт", default=None)
     name = models.CharField(max_length=150, verbose_name="Название")
+    # the link of the order history without a join, kept by orders.signals
+    # when the product is renamed
+    product_slug = models.SlugField(max_length=200, blank=True, default="", editable=False, verbose_name="URL товара")
     price = models.DecimalField(max_digits=7, decimal_places=2, verbose_name="Цена")
     quantity = models.PositiveIntegerField(default=0, verbose_name="Количество")
+    # price * quantity, price is the selling price snapshotted at checkout
+    total_price = models.DecimalField(default=0, max_digits=10, decimal_places=2, editable=False, verbose_name="Общая стоимость")
     created_timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Дата продажи")
 
 
@@ -51,8 +105,21 @@ class OrderItem(models.Model):
 
     objects = OrderitemQueryset.as_manager()
 
+    def save(self, *args, **kwargs):
+        self.total_price = line_total(self.price, self.quantity)
+        self.product_slug = (self.product.slug or "") if self.product_id else ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {"price", "quantity"} & update_fields:
+                update_fields.add("total_price")
+            if "product" in update_fields:
+                update_fields.add("product_slug")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
     def products_price(self):
-        return round(self.product.sell_price() * self.quantity, 2)
+        return self.total_price
 
     def __str__(self):
         return f"Товар {self.name} | Заказ № {self.order.pk}"
\ No newline at end of file
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+
+from goods.models import Products
+from orders.cache import bump_orders_version
+from orders.models import Order, OrderItem
+
+
+def invalidate_order_history(sender, instance, **kwargs):
+    if instance.user_id:
+        bump_orders_version(instance.user_id)
+
+
+def invalidate_order_history_by_item(sender, instance, **kwargs):
+    # the lines of the admin inline carry their order: no query per line
+    if OrderItem.order.is_cached(instance):
+        user_id = instance.order.user_id if instance.order else None
+    else:
+        user_id = Order.objects.filter(id=instance.order_id).values_list("user_id", flat=True).first()
+    if user_id:
+        bump_orders_version(user_id)
+
+
+def follow_product_slug(sender, instance, created, raw, **kwargs):
+    # the links of the order history follow a renamed product
+    old_slug = getattr(instance, "_loaded_slug", None)
+    if created or raw or old_slug == instance.slug:
+        return
+    OrderItem.objects.filter(product=instance).update(product_slug=instance.slug or "")
+
+
+post_save.connect(invalidate_order_history, sender=Order)
+post_delete.connect(invalidate_order_history, sender=Order)
+post_save.connect(invalidate_order_history_by_item, sender=OrderItem)
+post_delete.connect(invalidate_order_history_by_item, sender=OrderItem)
+post_save.connect(follow_product_slug, sender=Products)
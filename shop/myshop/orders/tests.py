@@ -1,3 +1,230 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from carts.models import Cart, Reservation
+from common.testing import QueryBudgetMixin
+from goods.models import Products
+from orders.cache import bump_orders_version, get_orders_page
+from orders.models import Order, OrderItem
+from users.models import User
+
+
+ORDER_DATA = {
+    "first_name": "Иван",
+    "last_name": "Иванов",
+    "phone_number": "9001234567",
+    "requires_delivery": "0",
+    "delivery_address": "",
+    "payment_on_get": "1",
+}
+
+
+class CheckoutBudgetCases(QueryBudgetMixin):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("user", password="password")
+        self.client.force_login(self.user)
+
+    def create_order(self):
+        # several lines: an N+1 repeats its query per line
+        for product in Products.objects.all()[:3]:
+            self.client.post(reverse("cart:cart_add"), {"product_id": product.id})
+        cache.clear()
+        self.assertWithinBudget("orders:create_order", data=ORDER_DATA, method="post", status_code=302)
+        self.assertEqual(Order.objects.get(user=self.user).orderitem_set.count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_form(self):
+        self.assertWithinBudget("orders:create_order")
+
+    def test_create_order(self):
+        self.create_order()
+
+    @override_settings(CART_RESERVATION_TTL=900)
+    def test_create_order_with_holds(self):
+        self.create_order()
+
+
+class QueryBudgetTests(CheckoutBudgetCases, TestCase):
+    pass
+
+
+class AutocommitQueryBudgetTests(CheckoutBudgetCases, TransactionTestCase):
+    # outside the transaction of TestCase atomic() sends BEGIN, as in a real
+    # request; it must not count towards the budget
+    pass
+
+
+@override_settings(CART_RESERVATION_TTL=900)
+class CheckoutHoldsTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", password="password")
+        self.client.force_login(self.user)
+        Products.objects.filter(pk=1).update(quantity=5)
+        for _ in range(3):
+            self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+
+    def stock(self):
+        return Products.objects.values_list("quantity", "reserved").get(pk=1)
+
+    def test_holds_converted(self):
+        self.assertEqual(self.stock(), (5, 3))
+        response = self.client.post(reverse("orders:create_order"), ORDER_DATA)
+        self.assertRedirects(response, reverse("user:profile"), fetch_redirect_response=False)
+        # sold from the hold, nothing is left reserved
+        self.assertEqual(self.stock(), (2, 0))
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(Order.objects.get().orderitem_set.get().quantity, 3)
+
+    def test_own_hold_can_be_bought(self):
+        # all the free stock is held by this cart
+        Products.objects.filter(pk=1).update(quantity=3)
+        self.client.post(reverse("orders:create_order"), ORDER_DATA)
+        self.assertEqual(self.stock(), (0, 0))
+
+    def test_hold_released_meanwhile(self):
+        # the release sweep gets to the hold between the read of the cart and
+        # the conversion: the hold is back in the stock already, it must not
+        # be subtracted from reserved a second time
+        bulk_create = OrderItem.objects.bulk_create
+
+        def release_then_create(*args, **kwargs):
+            Reservation.objects.all().release()
+            return bulk_create(*args, **kwargs)
+
+        # the queries of the sweep are over the budget of the request
+        with mock.patch.object(OrderItem.objects, "bulk_create", release_then_create):
+            with self.assertLogs("myshop.queries", "WARNING"):
+                response = self.client.post(reverse("orders:create_order"), ORDER_DATA)
+        self.assertRedirects(response, reverse("orders:create_order"), fetch_redirect_response=False)
+        self.assertIn("Резерв товаров истек", [str(message) for message in get_messages(response.wsgi_request)][0])
+        # rolled back, the sweep's release included
+        self.assertEqual(self.stock(), (5, 3))
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+
+
+class OrderHistoryTests(TestCase):
+    fixtures = ["fixtures/goods/categories.json", "fixtures/goods/products.json"]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user", password="password")
+        self.client.force_login(self.user)
+        # 135.00 and 90.68 with the discounts
+        self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+        self.client.post(reverse("cart:cart_add"), {"product_id": 1})
+        self.client.post(reverse("cart:cart_add"), {"product_id": 2})
+        # as committed: the version bump of the checkout has run
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("orders:create_order"), ORDER_DATA)
+        self.order = Order.objects.get(user=self.user)
+
+    def test_stored_totals(self):
+        items = list(self.order.orderitem_set.values_list("name", "product_slug", "price", "quantity", "total_price"))
+        self.assertEqual(items, [
+            ("Чайный столик и три стула", "chajnyj-stolik-i-tri-stula", Decimal("135.00"), 2, Decimal("270.00")),
+            ("Чайный столик и два стула", "chajnyj-stolik-i-dva-stula", Decimal("90.68"), 1, Decimal("90.68")),
+        ])
+        self.assertEqual(self.order.total_price, Decimal("360.68"))
+        self.assertEqual(Order.objects.filter(user=self.user).totals(), {"orders": 1, "total_price": Decimal("360.68")})
+
+        # the price of the day of the order stays
+        Products.objects.filter(pk=1).update(price=1000)
+        response = self.client.get(reverse("user:profile"))
+        self.assertContains(response, "<td>270,00</td>", html=True)
+        self.assertContains(response, "<th>360,68</th>", html=True)
+
+        # a line edited later keeps its total, and the order its sum
+        item = self.order.orderitem_set.get(product_id=1)
+        item.quantity = 3
+        item.save(update_fields=["quantity"])
+        self.assertEqual(OrderItem.objects.get(pk=item.pk).total_price, Decimal("405.00"))
+        Order.objects.filter(pk=self.order.pk).update_totals()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total_price, Decimal("495.68"))
+
+    def test_product_link(self):
+        url = reverse("catalog:product", args=["chajnyj-stolik-i-tri-stula"])
+        self.assertContains(self.client.get(reverse("user:profile")), f'href="{url}"')
+
+        product = Products.objects.get(pk=1)
+        product.slug = "stolik-i-tri-stula"
+        product.save()
+        self.assertEqual(OrderItem.objects.get(product_id=1).product_slug, "stolik-i-tri-stula")
+        cache.clear()
+        response = self.client.get(reverse("user:profile"))
+        self.assertContains(response, f'href="{reverse("catalog:product", args=["stolik-i-tri-stula"])}"')
+
+        # a deleted product keeps its name in the history, without the link
+        product.delete()
+        cache.clear()
+        response = self.client.get(reverse("user:profile"))
+        self.assertContains(response, "Чайный столик и три стула")
+        self.assertNotContains(response, "stolik-i-tri-stula")
+
+    def test_status_change_invalidates(self):
+        self.assertEqual(get_orders_page(self.user.id)[0].status, "В обработке")
+        self.order.status = "Отправлен"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+        self.assertEqual(get_orders_page(self.user.id)[0].status, "Отправлен")
+
+    def test_bump_after_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            bump_orders_version(self.user.id)
+            bump_orders_version(self.user.id)
+        self.assertEqual(len(callbacks), 1)
+
+        # a bump dropped with its savepoint doesn't stand for the next one
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    bump_orders_version(self.user.id)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            bump_orders_version(self.user.id)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_admin_inline_save(self):
+        admin = User.objects.create_superuser("admin", password="password")
+        self.client.force_login(admin)
+        url = reverse("admin:orders_order_change", args=[self.order.pk])
+        response = self.client.get(url)
+        data = {
+            name: value for name, value in response.context["adminform"].form.initial.items()
+            if value is not None and name != "created_timestamp"
+        }
+        for formset in response.context["inline_admin_formsets"]:
+            formset = formset.formset
+            data.update({f"{formset.prefix}-{name}": value for name, value in formset.management_form.initial.items()})
+            for form in formset:
+                data.update({form.add_prefix(name): value for name, value in form.initial.items() if value is not None})
+                data[form.add_prefix("id")] = form.instance.pk
+                data[form.add_prefix("quantity")] = 5
+        get_orders_page(self.user.id)
+
+        # the test client resets connection.queries on each request
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                response = self.client.post(url, data)
+        self.assertRedirects(response, reverse("admin:orders_order_changelist"))
+        # the user of the order is not looked up per line, the version is bumped once
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT "order"."user_id"')])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual([item.quantity for item in get_orders_page(self.user.id)[0].items], [5, 5])
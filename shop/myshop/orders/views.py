@@ -2,15 +2,18 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Greatest
 from django.forms import ValidationError
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.views.generic import FormView
 
-from carts.models import Cart
+from carts.models import Cart, Reservation
+from goods.models import Products
 
 from orders.forms import CreateOrderForm
-from orders.models import Order, OrderItem
+from orders.models import Order, OrderItem, line_total
 
 
 class CreateOrderView(LoginRequiredMixin, FormView):
@@ -28,9 +31,42 @@ class CreateOrderView(LoginRequiredMixin, FormView):
         try:
             with transaction.atomic():
                 user = self.request.user
-                cart_items = Cart.objects.filter(user=user)
+                # product_id -> (quantity, held by the cart), (user, product) is unique in Cart
+                cart_items = {}
+                reservation_ids = []
+                for product_id, quantity, reservation_id, held in Cart.objects.filter(user=user).values_list(
+                    "product_id", "quantity", "reservation__id", "reservation__quantity"
+                ):
+                    cart_items[product_id] = (quantity, held or 0)
+                    if reservation_id:
+                        reservation_ids.append(reservation_id)
+
+                if cart_items:
+                    # Без SELECT ... FOR UPDATE: остатки проверяет и списывает условный UPDATE
+                    # в конце, строки товаров блокируются только на время коммита
+                    products = Products.objects.in_bulk(cart_items)
+
+                    for product_id, (quantity, held) in cart_items.items():
+                        product = products[product_id]
+                        # свой резерв покупатель может выкупить, чужие - нет
+                        available = product.quantity - product.reserved + held
+                        if available < quantity:
+                            raise ValidationError(f'Недостаточное количество товара {product.name} на складе\
+                                                       В наличии - {max(available, 0)}')
+
+                    # Строки заказа с ценой и суммой на момент оформления
+                    items = [
+                        OrderItem(
+                            product=products[product_id],
+                            name=products[product_id].name,
+                            product_slug=products[product_id].slug or '',
+                            price=products[product_id].sell_price,
+                            quantity=quantity,
+                            total_price=line_total(products[product_id].sell_price, quantity),
+                        )
+                        for product_id, (quantity, held) in cart_items.items()
+                    ]
 
-                if cart_items.exists():
                     # Создать заказ
                     order = Order.objects.create(
                         user=user,
@@ -38,31 +74,42 @@ class CreateOrderView(LoginRequiredMixin, FormView):
                         requires_delivery=form.cleaned_data['requires_delivery'],
                         delivery_address=form.cleaned_data['delivery_address'],
                         payment_on_get=form.cleaned_data['payment_on_get'],
+                        total_price=sum(item.total_price for item in items),
                     )
                     # Создать заказанные товары
-                    for cart_item in cart_items:
-                        product=cart_item.product
-                        name=cart_item.product.name
-                        price=cart_item.product.sell_price()
-                        quantity=cart_item.quantity
-
-
-                        if product.quantity < quantity:
-                            raise ValidationError(f'Недостаточное количество товара {name} на складе\
-                                                       В наличии - {product.quantity}')
-
-                        OrderItem.objects.create(
-                            order=order,
-                            product=product,
-                            name=name,
-                            price=price,
-                            quantity=quantity,
-                        )
-                        product.quantity -= quantity
-                        product.save()
+                    for item in items:
+                        item.order = order
+                    OrderItem.objects.bulk_create(items)
+
+                    # Резервы удаляются до списания: DELETE ждет sweep, который их уже
+                    # освобождает, и резерв, возвращенный им на склад, не вычитается
+                    # из reserved второй раз (порядок блокировок тот же, что в release)
+                    if reservation_ids:
+                        deleted, _ = Reservation.objects.filter(id__in=reservation_ids).delete()
+                        if deleted != len(reservation_ids):
+                            raise ValidationError('Резерв товаров истек, оформите заказ еще раз')
+
+                    # Списать остатки и превратить резервы в продажу одним UPDATE;
+                    # условие quantity - (reserved - held) >= x не дает продать больше, чем есть
+                    ordered = Case(
+                        *[When(id=product_id, then=Value(quantity)) for product_id, (quantity, held) in cart_items.items()],
+                        output_field=PositiveIntegerField(),
+                    )
+                    converted = Case(
+                        *[When(id=product_id, then=Value(held)) for product_id, (quantity, held) in cart_items.items()],
+                        output_field=PositiveIntegerField(),
+                    )
+                    updated = Products.objects.filter(
+                        id__in=cart_items, quantity__gte=F("reserved") - converted + ordered
+                    ).update(
+                        quantity=F("quantity") - ordered,
+                        reserved=Greatest(F("reserved") - converted, 0),
+                    )
+                    if updated != len(cart_items):
+                        raise ValidationError('Недостаточное количество товара на складе')
 
                     # Очистить корзину пользователя после создания заказа
-                    cart_items.delete()
+                    Cart.objects.filter(user=user).delete()
 
                     messages.success(self.request, 'Заказ оформлен!')
                     return redirect('user:profile')
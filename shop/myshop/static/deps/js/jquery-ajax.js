@@ -3,6 +3,17 @@ $(document).ready(function () {
     // берем в переменную элемент разметки с id jq-notification для оповещений от ajax
     var successMessage = $("#jq-notification");
 
+    // Сообщение о нехватке товара и корзина в состоянии до запроса
+    function showStockError(data) {
+        successMessage.html(data.message);
+        successMessage.fadeIn(400);
+        setTimeout(function () {
+            successMessage.fadeOut(400);
+        }, 7000);
+
+        $("#cart-items-container").html(data.cart_items_html);
+    }
+
     // Ловим собыитие клика по кнопке добавить в корзину
     $(document).on("click", ".add-to-cart", function (e) {
         // Блокируем его базовое действие
@@ -46,6 +57,11 @@ $(document).ready(function () {
             },
 
             error: function (data) {
+                // 409 - товара не хватило на резерв, корзина приходит без изменений
+                if (data.status === 409) {
+                    showStockError(data.responseJSON);
+                    return;
+                }
                 console.log("Ошибка при добавлении товара в корзину");
             },
         });
@@ -174,6 +190,11 @@ $(document).ready(function () {
 
             },
             error: function (data) {
+                // 409 - товара не хватило на резерв, корзина приходит без изменений
+                if (data.status === 409) {
+                    showStockError(data.responseJSON);
+                    return;
+                }
                 console.log("Ошибка при добавлении товара в корзину");
             },
         });
@@ -188,15 +209,25 @@ $(document).ready(function () {
         }, 7000);
     }
 
+    // Страница из кэша: корзина и csrf токены приходят отдельным запросом
+    var cartFragment = $("#cart-fragment");
+    if (cartFragment.length > 0) {
+        $.get(cartFragment.data("url"), function (data) {
+            cartFragment.replaceWith(data.cart_html);
+            $("[name=csrfmiddlewaretoken]").val(data.csrf_token);
+        });
+    }
+
     // При клике по значку корзины открываем всплывающее(модальное) окно
-    $('#modalButton').click(function () {
+    // (через document - кнопка может появиться после загрузки страницы)
+    $(document).on("click", "#modalButton", function () {
         $('#exampleModal').appendTo('body');
 
         $('#exampleModal').modal('show');
     });
 
     // Собыите клик по кнопке закрыть окна корзины
-    $('#exampleModal .btn-close').click(function () {
+    $(document).on("click", "#exampleModal .btn-close", function () {
         $('#exampleModal').modal('hide');
     });
 
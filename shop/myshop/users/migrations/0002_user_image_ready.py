@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_ready',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Аватар обработан'),
+        ),
+    ]
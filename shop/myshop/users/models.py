@@ -4,6 +4,8 @@ from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
     image = models.ImageField(upload_to='users_images', blank=True, null=True, verbose_name='Аватар')
+    # False until the worker has resized the upload and stripped its EXIF (users.tasks)
+    image_ready = models.BooleanField(default=True, editable=False, verbose_name='Аватар обработан')
     phone_number = models.CharField(max_length=10, blank=True, null=True)
 
     class Meta:
@@ -13,3 +15,21 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a new avatar is told apart from the stored one by its name
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        if fields is None or "image" in fields:
+            self._loaded_image = self.image.name
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "image" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "image_ready"}
+        super().save(*args, **kwargs)
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, pre_save
+
+from jobs.queue import enqueue
+from users.models import User
+
+
+def mark_new_avatar(sender, instance, raw, **kwargs):
+    # the profile shows the placeholder until the worker is done with it
+    if raw:
+        return
+    image = instance.image
+    instance._image_changed = bool(image) and (
+        not image._committed or image.name != getattr(instance, "_loaded_image", None)
+    )
+    if instance._image_changed:
+        instance.image_ready = False
+
+
+def process_new_avatar(sender, instance, raw, **kwargs):
+    if raw or not getattr(instance, "_image_changed", False):
+        return
+    instance._image_changed = False
+    instance._loaded_image = instance.image.name
+    enqueue("users.process_avatar", instance.pk, instance.image.name)
+
+
+pre_save.connect(mark_new_avatar, sender=User)
+post_save.connect(process_new_avatar, sender=User)
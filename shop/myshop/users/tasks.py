@@ -0,0 +1,36 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from common.images import encode_image, open_image
+from jobs.queue import task
+from users.models import User
+
+
+@task("users.process_avatar")
+def process_avatar(user_id, image_name):
+    # the upload is replaced by a small JPEG without EXIF (GPS, camera)
+    user = User.objects.filter(pk=user_id, image=image_name).only("id", "image").first()
+    if user is None:
+        # another avatar since then, its own job does that one
+        return
+    storage = user.image.storage
+    image = open_image(user.image)
+    image.thumbnail((settings.AVATAR_SIZE, settings.AVATAR_SIZE))
+    data = encode_image(image, "JPEG", settings.AVATAR_QUALITY)
+
+    # named by the user and the content, not by the upload: a re-upload of
+    # a processed avatar doesn't grow the name, and a new avatar gets a new
+    # URL past the browser cache
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    name = f"{User._meta.get_field('image').upload_to}/avatar_{user_id}_{digest}.jpg"
+    # the same avatar once more: the file is there already
+    created = not storage.exists(name)
+    if created:
+        name = storage.save(name, ContentFile(data))
+    if User.objects.filter(pk=user_id, image=image_name).update(image=name, image_ready=True):
+        if image_name != name:
+            storage.delete(image_name)
+    elif created:
+        storage.delete(name)
@@ -1,3 +1,31 @@
 from django.test import TestCase
 
-# Create your tests here.
+from carts.models import Cart
+from common.testing import QueryBudgetMixin
+from goods.models import Products
+from orders.models import Order, OrderItem
+from users.models import User
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("user", password="password")
+        self.client.force_login(self.user)
+        products = list(Products.objects.all()[:5])
+        # several lines and orders: an N+1 repeats its query per row
+        Cart.objects.bulk_create(Cart(user=self.user, product=product, quantity=2) for product in products)
+        for _ in range(3):
+            order = Order.objects.create(user=self.user, phone_number="9001234567")
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, name=product.name, price=product.sell_price, quantity=1)
+                for product in products
+            )
+
+    def test_profile(self):
+        response = self.assertWithinBudget("user:profile")
+        self.assertEqual(len(response.context["orders"]), 3)
+
+    def test_users_cart(self):
+        self.assertContains(self.assertWithinBudget("user:users_cart"), "Оформить заказ")
@@ -4,13 +4,13 @@ from django.contrib import auth, messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.cache import cache
 from django.db.models import Prefetch
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import redirect, render
 from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, TemplateView, UpdateView
-from carts.models import Cart
-from common.mixins import CacheMixin
-from orders.models import Order, OrderItem
+from carts.utils import merge_anonymous_cart
+from goods.paginators import InvalidCursor
+from orders.cache import get_orders_page
 
 from users.forms import ProfileForm, UserLoginForm, UserRegistrationForm
 
@@ -27,23 +27,18 @@ class UserLoginView(LoginView):
         return reverse_lazy('main:index')
     
     def form_valid(self, form):
+        # login() changes the session key, the anonymous cart is found by the old one
         session_key = self.request.session.session_key
 
         user = form.get_user()
 
-        if user:
-            auth.login(self.request, user)
-            if session_key:
-                # delete old authorized user carts
-                forgot_carts = Cart.objects.filter(user=user)
-                if forgot_carts.exists():
-                    forgot_carts.delete()
-                # add new authorized user carts from anonimous session
-                Cart.objects.filter(session_key=session_key).update(user=user)
+        auth.login(self.request, user)
+        # anonymous cart (cookie or session rows) is added to the user's cart
+        merge_anonymous_cart(self.request, user, session_key)
 
-                messages.success(self.request, f"{user.username}, Вы вошли в аккаунт")
+        messages.success(self.request, f"{user.username}, Вы вошли в аккаунт")
 
-                return HttpResponseRedirect(self.get_success_url())
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -64,8 +59,7 @@ class UserRegistrationView(CreateView):
             form.save()
             auth.login(self.request, user)
 
-        if session_key:
-            Cart.objects.filter(session_key=session_key).update(user=user)
+        merge_anonymous_cart(self.request, user, session_key)
 
         messages.success(self.request, f"{user.username}, Вы успешно зарегистрированы и вошли в аккаунт")
         return HttpResponseRedirect(self.success_url)
@@ -76,10 +70,12 @@ class UserRegistrationView(CreateView):
         return context
 
 
-class UserProfileView(LoginRequiredMixin, CacheMixin , UpdateView):
+class UserProfileView(LoginRequiredMixin, UpdateView):
     template_name = 'users/profile.html'
     form_class = ProfileForm
     success_url = reverse_lazy('users:profile')
+    orders_cursor_kwarg = 'orders'
+    orders_per_page = 10
 
     def get_object(self, queryset=None):
         return self.request.user
@@ -96,15 +92,13 @@ class UserProfileView(LoginRequiredMixin, CacheMixin , UpdateView):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Home - Кабинет'
 
-        # Можно вынести сам запрос в отдельный метод этого класса контроллера
-        orders = Order.objects.filter(user=self.request.user).prefetch_related(
-                Prefetch(
-                    "orderitem_set",
-                    queryset=OrderItem.objects.select_related("product"),
-                )
-            ).order_by("-id")
-
-        context['orders'] = self.set_get_cache(orders, f"user_{self.request.user.id}_orders", 60)
+        # одна страница истории заказов, закешированная под версией заказов пользователя
+        try:
+            context['orders'] = get_orders_page(
+                self.request.user.id, self.request.GET.get(self.orders_cursor_kwarg), self.orders_per_page
+            )
+        except InvalidCursor as e:
+            raise Http404(str(e))
         return context
 
 